@@ -0,0 +1,56 @@
+"""
+Micro-benchmarks for parsing Vend API timestamps.
+
+Run from the repository root with ``python benchmarks/bench_parse_date.py``.
+"""
+import os
+import re
+import sys
+import timeit
+from itertools import cycle
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from django.conf import settings
+
+settings.configure()
+
+import dateutil.parser
+
+from django_vend.core.forms import VALID_DATE_RE
+from django_vend.core.utils import parse_date, parse_vend_date
+
+NUMBER = 20000
+REPEATED = '2014-07-01T20:22:58+00:00'
+DISTINCT = ['2014-07-{:02d}T{:02d}:{:02d}:58+00:00'.format(
+                day, hour, minute)
+            for day in range(1, 29) for hour in range(24)
+            for minute in range(0, 60, 5)]
+VALID_DATE = VALID_DATE_RE.pattern
+
+
+def per_call(stmt, number=NUMBER):
+    seconds = min(timeit.repeat(stmt, number=number, repeat=5))
+    return seconds / number * 1e6
+
+
+def main():
+    distinct = cycle(DISTINCT)
+    results = [
+        ('dateutil.parser.parse',
+         per_call(lambda: dateutil.parser.parse(REPEATED))),
+        ('parse_date, repeated value (cached)',
+         per_call(lambda: parse_date(REPEATED))),
+        ('parse_date, distinct values (uncached)',
+         per_call(lambda: parse_vend_date.__wrapped__(next(distinct)))),
+        ('valid_date, uncompiled pattern',
+         per_call(lambda: re.search(VALID_DATE, REPEATED))),
+        ('valid_date, compiled pattern',
+         per_call(lambda: VALID_DATE_RE.search(REPEATED))),
+    ]
+    for name, usec in results:
+        print('{:<42} {:8.2f} usec/call'.format(name, usec))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Peak memory of decoding a large Vend API collection whole versus streaming.
+
+Each mode runs in a fresh interpreter so that its peak RSS is measured on
+its own. Run from the repository root with
+``python benchmarks/bench_streaming.py [objects]``.
+"""
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from itertools import islice
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from django_vend.core.streaming import JSONArrayStream
+
+OBJECTS = 100000
+CHUNK_SIZE = 64 * 1024
+BATCH_SIZE = 1000
+
+
+def make_object(i):
+    return {
+        'id': '{:08x}-a683-11e4-ef46-e8b98f1a7ae4'.format(i),
+        'name': 'Product {}'.format(i),
+        'handle': 'product-{}'.format(i),
+        'sku': 'SKU{:08d}'.format(i),
+        'description': 'A synthetic product used for benchmarking. ' * 4,
+        'supply_price': '12.50000',
+        'active': True,
+        'created_at': '2016-12-13T21:18:38+00:00',
+        'updated_at': '2016-12-14T09:02:11+00:00',
+        'deleted_at': None,
+        'version': 1000000 + i,
+    }
+
+
+def iter_payload(objects):
+    """
+    Yield a collection response in CHUNK_SIZE pieces, generated as it is
+    read, as if arriving from the network.
+    """
+    pending = [b'{"data": [']
+    size = len(pending[0])
+    for i in range(objects):
+        piece = (b',' if i else b'') + json.dumps(make_object(i)).encode()
+        pending.append(piece)
+        size += len(piece)
+        if size >= CHUNK_SIZE:
+            data = b''.join(pending)
+            while len(data) >= CHUNK_SIZE:
+                yield data[:CHUNK_SIZE]
+                data = data[CHUNK_SIZE:]
+            pending, size = [data], len(data)
+    pending.append(b'], "version": {"min": 1000000, "max": %d}}'
+                   % (1000000 + objects - 1))
+    yield b''.join(pending)
+
+
+def consume(objects):
+    """
+    Take the objects in batches, as parse_collection does, and drop them.
+    """
+    objects = iter(objects)
+    count = 0
+    while True:
+        batch = list(islice(objects, BATCH_SIZE))
+        if not batch:
+            return count
+        count += len(batch)
+
+
+def run(mode, objects):
+    chunks = iter_payload(objects)
+    start = time.perf_counter()
+    if mode == 'whole':
+        # What Response.json() does: read the whole body, then decode it
+        data = json.loads(b''.join(chunks))
+        count = consume(data['data'])
+    else:
+        count = consume(JSONArrayStream(chunks, 'data'))
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({'count': count, 'seconds': elapsed, 'peak_mb': peak}))
+
+
+def main():
+    objects = int(sys.argv[1]) if len(sys.argv) > 1 else OBJECTS
+    print('{} objects, {} KB chunks, batches of {}'.format(
+        objects, CHUNK_SIZE // 1024, BATCH_SIZE))
+    for mode in ('baseline', 'whole', 'stream'):
+        if mode == 'baseline':
+            args = [sys.executable, __file__, '--run', 'stream', '0']
+        else:
+            args = [sys.executable, __file__, '--run', mode, str(objects)]
+        result = json.loads(subprocess.check_output(args))
+        print('{:<10} peak RSS {:8.1f} MB  {:6.2f}s'.format(
+            mode, result['peak_mb'], result['seconds']))
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--run']:
+        run(sys.argv[2], int(sys.argv[3]))
+    else:
+        main()
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-17 14:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vend_auth', '0009_venduser_retrieved'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='venduser',
+            name='fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=40),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 2.2.28 on 2026-10-17 14:47
+
+from django.db import migrations
+from django.db.models import Count
+
+
+def remove_duplicate_vendusers(apps, schema_editor):
+    # Keep the most recently retrieved VendUser for each retailer and uid,
+    # moving the VendProfile links of the others to it
+    VendUser = apps.get_model('vend_auth', 'venduser')
+    duplicates = (VendUser.objects.values('retailer', 'uid')
+                  .annotate(count=Count('pk')).filter(count__gt=1))
+    for duplicate in duplicates:
+        vendusers = list(VendUser.objects.filter(
+            retailer=duplicate['retailer'], uid=duplicate['uid'])
+            .order_by('-retrieved', '-pk'))
+        kept = vendusers[0]
+        for vu in vendusers[1:]:
+            for vp in vu.vendprofiles.all():
+                vp.vendusers.add(kept)
+            vu.delete()
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vend_auth', '0010_venduser_fingerprint'),
+    ]
+
+    # Deleting rows leaves deferred foreign key checks pending on some
+    # databases, so the constraint is added in the next migration
+    operations = [
+        migrations.RunPython(
+            remove_duplicate_vendusers, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-17 14:47
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vend_auth', '0011_remove_duplicate_vendusers'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='venduser',
+            unique_together={('retailer', 'uid')},
+        ),
+    ]
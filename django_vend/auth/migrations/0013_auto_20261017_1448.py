@@ -0,0 +1,22 @@
+# Generated by Django 2.2.28 on 2026-10-17 14:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vend_auth', '0012_auto_20261017_1447'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='venduser',
+            name='deleted_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddIndex(
+            model_name='venduser',
+            index=models.Index(fields=['retailer', 'deleted_at'], name='vend_auth_v_retaile_d4fc01_idx'),
+        ),
+    ]
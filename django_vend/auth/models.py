@@ -3,63 +3,54 @@ from django.conf import settings
 from django.utils import timezone
 
 from django_vend.core.managers import BaseVendAPIManager
+from django_vend.core.mapping import FieldMapping, VendField
 from django_vend.core.utils import get_vend_setting, parse_date
 from django_vend.core.exceptions import VendSyncError
 
 DEFAULT_USER_IMAGE = get_vend_setting('VEND_DEFAULT_USER_IMAGE')
 
+
+def parse_utc_date(value):
+    date = parse_date(value)
+    if date is not None and timezone.is_naive(date):
+        date = timezone.make_aware(date, timezone.utc)
+    return date
+
+def parse_image_url(url):
+    return url or DEFAULT_USER_IMAGE
+
+def parse_account_type(account_type_str):
+    initial = account_type_str[:1].upper()
+    if initial not in (c[0] for c in VendUser.ACCOUNT_TYPE_CHOICES):
+        raise VendSyncError(
+            'Invalid account type {!r}'.format(account_type_str))
+    return initial
+
+
 class VendUserManager(BaseVendAPIManager):
 
-    resource_collection_url = 'https://{}.vendhq.com/api/users'
-    resource_object_url = 'https://{}.vendhq.com/api/1.0/user/{}'
-
-    json_collection_name = 'users'
-
-    def get_account_type(self, account_type_str, exception=Exception):
-        try:
-            initial = account_type_str[0].upper()
-        except IndexError as e:
-            raise exception(e)
-        choices = [c[0] for c in self.model.ACCOUNT_TYPE_CHOICES]
-        if not initial in choices:
-            raise exception(e)
-        return initial
-
-    def parse_json_object(self, json_obj):
-        uid = self.get_dict_value(json_obj, 'id')
-        name = self.get_dict_value(json_obj, 'name')
-        display_name = self.get_dict_value(json_obj, 'display_name')
-        email = self.get_dict_value(json_obj, 'email')
-        created_at = parse_date(self.get_dict_value(json_obj, 'created_at'))
-        updated_at = parse_date(self.get_dict_value(json_obj, 'updated_at'))
-        obj = {
-            'name': name,
-            'display_name': display_name,
-            'email': email,
-            'created_at': timezone.make_aware(created_at, timezone.utc),
-            'updated_at': timezone.make_aware(updated_at, timezone.utc),
-        }
-        if 'image' in json_obj:
-            image = self.get_dict_value(json_obj['image'], 'url')
-            obj['image'] = image
-
-        return obj
-
-    def parse_collection(self, retailer, result):
-        created = False
-
-        for object_stub in result:
-            pk = self.get_dict_value(object_stub, 'id')
-            defaults = self.parse_json_collection_object(object_stub)
-            created = created or self._retrieve_object_from_api(
-                retailer, pk, defaults=defaults)
-
-        return created
-
-    def parse_json_collection_object(self, json_obj):
-        account_type_str = self.get_dict_value(json_obj, 'account_type')
-        account_type = self.get_account_type(account_type_str)
-        return {'account_type': account_type}
+    resource_name = 'users'
+    webhook_events = ('user.update',)
+
+    resource_collection_url = 'https://{}.vendhq.com/api/2.0/users'
+    resource_object_url = 'https://{}.vendhq.com/api/2.0/users/{}'
+
+    json_collection_name = 'data'
+    json_object_name = 'data'
+    upsert_conflict_fields = ('retailer', 'uid')
+    versioned = True
+
+    field_mapping = FieldMapping(
+        VendField('username', 'name'),
+        VendField('display_name'),
+        VendField('email'),
+        VendField('account_type', converter=parse_account_type),
+        VendField('image_source', 'image', required=False,
+                  converter=parse_image_url, default=DEFAULT_USER_IMAGE),
+        VendField('created_at', converter=parse_utc_date),
+        VendField('updated_at', converter=parse_utc_date),
+        VendField('deleted_at', required=False, converter=parse_utc_date),
+    )
 
 
 class VendRetailer(models.Model):
@@ -108,11 +99,20 @@ class VendUser(models.Model):
     )
     created_at = models.DateTimeField()
     updated_at = models.DateTimeField()
+    deleted_at = models.DateTimeField(null=True)
 
     # time retrieved from Vend API
     retrieved = models.DateTimeField()
+    # digest of the data retrieved from Vend API
+    fingerprint = models.CharField(max_length=40, blank=True, editable=False)
 
     objects = VendUserManager()
 
+    class Meta:
+        unique_together = ('retailer', 'uid')
+        indexes = [
+            models.Index(fields=['retailer', 'deleted_at']),
+        ]
+
     def __str__(self):
         return self.name
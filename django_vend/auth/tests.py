@@ -1,3 +1,125 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import RequestFactory, TestCase
+from django.utils.timezone import now
+
+from django_vend.core.exceptions import VendCircuitOpenError
+from .models import (DEFAULT_USER_IMAGE, VendProfile, VendRetailer,
+                     VendUser)
+from .views import VendAuthVendUserListSelect, VendProfileSelectVendUsers
+
+
+class FakeResponse(object):
+
+    status_code = 200
+
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+class VendUserManagerTestCase(TestCase):
+
+    def setUp(self):
+        self.retailer = VendRetailer.objects.create(
+            name="TestRetailer",
+            access_token="some token",
+            expires=now(),
+            expires_in=0,
+            refresh_token="some other token",
+        )
+
+    def user_data(self, uid, account_type, version):
+        return {
+            "id": uid,
+            "username": "user{}".format(version),
+            "display_name": "User {}".format(version),
+            "email": "user{}@example.com".format(version),
+            "account_type": account_type,
+            "image_source": None,
+            "created_at": "2016-12-13T21:18:38+00:00",
+            "updated_at": "2016-12-14 09:02:11",
+            "deleted_at": None,
+            "version": version,
+        }
+
+    def test_synchronise(self):
+        uids = ["0adfd74a-153e-11e6-f182-ae0b9e2f3b1{}".format(i)
+                for i in range(3)]
+        users = [self.user_data(uid, account_type, 100 + i)
+                 for i, (uid, account_type)
+                 in enumerate(zip(uids, ["admin", "manager", "cashier"]))]
+        users[1]["image_source"] = "https://example.com/user.png"
+        pages = [{"data": users[:2]}, {"data": users[2:]}]
+
+        with self.settings(VEND_SYNC_PAGE_SIZE=2), \
+                mock.patch.object(VendUser.objects.session_pool, 'get',
+                                  side_effect=map(FakeResponse, pages)) as get:
+            self.assertTrue(VendUser.objects.synchronise(self.retailer))
+
+        # The whole collection arrives in pages, with no per-user requests
+        self.assertEqual(get.call_count, 2)
+        self.assertTrue(get.call_args[0][0].endswith('/api/2.0/users'))
+
+        self.assertEqual(
+            list(VendUser.objects.order_by('uid')
+                 .values_list('account_type', flat=True)),
+            [VendUser.ADMIN, VendUser.MANAGER, VendUser.CASHIER])
+        user = VendUser.objects.get(uid=uids[1])
+        self.assertEqual(user.name, "user101")
+        self.assertEqual(user.image, "https://example.com/user.png")
+        self.assertEqual(user.retailer, self.retailer)
+        self.assertEqual(user.updated_at.tzinfo.utcoffset(None).seconds, 0)
+        self.assertEqual(VendUser.objects.get(uid=uids[0]).image,
+                         DEFAULT_USER_IMAGE)
+
+    def test_invalid_account_type(self):
+        uid = "0adfd74a-153e-11e6-f182-ae0b9e2f3b10"
+        page = {"data": [self.user_data(uid, "owner", 100)]}
+        with mock.patch.object(VendUser.objects.session_pool, 'get',
+                               return_value=FakeResponse(page)), \
+                self.assertRaises(VendUser.objects.sync_exception):
+            VendUser.objects.synchronise(self.retailer)
+
+
+class VendUserViewsTestCase(TestCase):
+
+    def setUp(self):
+        self.retailer = VendRetailer.objects.create(
+            name="TestRetailer",
+            access_token="some token",
+            expires=now(),
+            expires_in=0,
+            refresh_token="some other token",
+        )
+        user = User.objects.create_user('user')
+        self.profile = VendProfile.objects.create(user=user,
+                                                  retailer=self.retailer)
+        self.request = RequestFactory().get('/')
+        self.request.user = user
+
+    def test_circuit_open_serves_local_data(self):
+        error = VendCircuitOpenError('Vend API requests are failing')
+        list_view = VendAuthVendUserListSelect(request=self.request)
+        select_view = VendProfileSelectVendUsers(request=self.request)
+
+        with mock.patch.object(VendUser.objects, 'synchronise',
+                               side_effect=error):
+            # Nothing to serve yet
+            with self.assertRaises(VendCircuitOpenError):
+                list_view.get_context_data()
+
+            venduser = VendUser.objects.create(
+                uid="0adfd74a-153e-11e6-f182-ae0b9e2f3b10", name="user",
+                display_name="User", email="user@example.com",
+                account_type=VendUser.CASHIER, created_at=now(),
+                updated_at=now(), retailer=self.retailer, retrieved=now())
+            self.profile.vendusers.add(venduser)
+            with self.assertLogs('django_vend.core.views', 'WARNING'):
+                context = list_view.get_context_data()
+            self.assertEqual(list(context['object_list']), [venduser])
+            with self.assertLogs('django_vend.core.views', 'WARNING'):
+                self.assertEqual(select_view.get_object(), self.profile)
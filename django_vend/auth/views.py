@@ -12,6 +12,7 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 import requests
 from oauthlib.common import generate_token
 
+from django_vend.core.views import synchronise_for_view
 from .models import VendRetailer, VendUser, VendProfile
 from .forms import VendProfileSelectVendUsersForm
 
@@ -133,7 +134,8 @@ class VendProfileSelectVendUsers(LoginRequiredMixin, UpdateView):
     success_url = reverse_lazy('vend_profile_select_vend_users')
 
     def get_object(self):
-        VendUser.objects.synchronise(self.request.user.vendprofile.retailer)
+        synchronise_for_view(VendUser.objects,
+                             self.request.user.vendprofile.retailer)
         return VendProfile.objects.get(user=self.request.user)
 
     def get_form_kwargs(self):
@@ -150,10 +152,12 @@ class VendAuthVendUserListSelect(LoginRequiredMixin, TemplateView):
 
     def get_queryset(self):
         return self.model.objects.filter(
-            vendprofiles=self.request.user.vendprofile)
+            vendprofiles=self.request.user.vendprofile,
+            deleted_at__isnull=True)
 
     def get_context_data(self, *args, **kwargs):
-        self.model.objects.synchronise(self.request.user.vendprofile.retailer)
+        synchronise_for_view(self.model.objects,
+                             self.request.user.vendprofile.retailer)
         return {'object_list': self.get_queryset()}
 
     def post(self, request, *args, **kwargs):
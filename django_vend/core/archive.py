@@ -0,0 +1,182 @@
+import gzip
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from uuid import uuid4
+
+from django_vend.core.utils import get_vend_setting
+
+logger = logging.getLogger(__name__)
+
+SUFFIX = '.json.gz'
+
+
+class ArchivedPayload(object):
+    """
+    A raw Vend API response body saved by PayloadArchive.
+    """
+
+    def __init__(self, path, retailer_name, resource):
+        self.path = path
+        self.retailer_name = retailer_name
+        self.resource = resource
+        self.timestamp = os.path.basename(path).split('-', 1)[0]
+
+    def read(self):
+        with gzip.open(self.path, 'rb') as f:
+            return f.read()
+
+    def load(self):
+        return json.loads(self.read().decode('utf-8'))
+
+    def __repr__(self):
+        return 'ArchivedPayload({!r})'.format(self.path)
+
+
+class PayloadArchive(object):
+    """
+    Saves each raw Vend API response body, gzipped, under the directory named
+    by VEND_API_ARCHIVE_DIR (disabled by default) as
+    ``<retailer>/<resource>/<UTC timestamp>-<random>.json.gz``.
+    """
+
+    def __init__(self, root=None):
+        self._root = root
+
+    @property
+    def root(self):
+        return self._root or get_vend_setting('VEND_API_ARCHIVE_DIR')
+
+    def is_enabled(self):
+        return bool(self.root)
+
+    def get_path(self, retailer_name, resource):
+        directory = os.path.join(self.root, retailer_name, resource)
+        os.makedirs(directory, exist_ok=True)
+        timestamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+        return os.path.join(directory, '{}-{}{}'.format(
+            timestamp, uuid4().hex[:8], SUFFIX))
+
+    def save(self, retailer, resource, content):
+        """
+        Archive a response body, returning its path, or None if the archive
+        is disabled or could not be written.
+        """
+        if not self.is_enabled():
+            return None
+        path = temp_path = f = None
+        try:
+            path = self.get_path(retailer.name, resource)
+            temp_path = path + '.tmp'
+            f = gzip.open(temp_path, 'wb')
+            f.write(content)
+            f.close()
+            os.replace(temp_path, path)
+        except OSError:
+            self._abandon(f, temp_path, path)
+            return None
+        return path
+
+    def tee(self, retailer, resource, chunks):
+        """
+        Yield ``chunks`` of a streamed response body, saving them as they go.
+        The body is only archived once all of it has been read.
+        """
+        if not self.is_enabled():
+            yield from chunks
+            return
+        path = temp_path = f = None
+        try:
+            path = self.get_path(retailer.name, resource)
+            temp_path = path + '.tmp'
+            f = gzip.open(temp_path, 'wb')
+        except OSError:
+            f = self._abandon(f, temp_path, path)
+
+        completed = False
+        try:
+            for chunk in chunks:
+                if f is not None:
+                    try:
+                        f.write(chunk)
+                    except OSError:
+                        f = self._abandon(f, temp_path, path)
+                yield chunk
+            completed = True
+        finally:
+            if f is not None and completed:
+                try:
+                    f.close()
+                    os.replace(temp_path, path)
+                except OSError:
+                    self._abandon(f, temp_path, path)
+            elif f is not None:
+                # An interrupted body is never archived, so that it cannot be
+                # replayed truncated
+                self._abandon(f, temp_path, path, log=False)
+
+    def _abandon(self, f, temp_path, path, log=True):
+        """
+        Give up writing a payload, deleting its temporary file. Archiving is
+        only a diagnostic aid, so errors are logged rather than raised.
+        """
+        if log:
+            logger.exception('Could not archive Vend API response to %s',
+                             path or self.root)
+        try:
+            if f is not None:
+                f.close()
+            if temp_path is not None:
+                os.remove(temp_path)
+        except OSError:
+            pass
+        return None
+
+    def iter_payloads(self, retailer_names=None, resources=None):
+        """
+        Yield the ArchivedPayloads for the given retailers and resources (or
+        all of them), oldest first.
+        """
+        payloads = []
+        for retailer_name in sorted(os.listdir(self.root)):
+            if retailer_names and retailer_name not in retailer_names:
+                continue
+            retailer_dir = os.path.join(self.root, retailer_name)
+            if not os.path.isdir(retailer_dir):
+                continue
+            for resource in sorted(os.listdir(retailer_dir)):
+                if resources and resource not in resources:
+                    continue
+                resource_dir = os.path.join(retailer_dir, resource)
+                if not os.path.isdir(resource_dir):
+                    continue
+                payloads.extend(
+                    ArchivedPayload(os.path.join(resource_dir, name),
+                                    retailer_name, resource)
+                    for name in os.listdir(resource_dir)
+                    if name.endswith(SUFFIX))
+        payloads.sort(key=lambda payload: (payload.timestamp, payload.path))
+        return iter(payloads)
+
+
+def replay_payload(manager, retailer, data):
+    """
+    Save the objects of an archived response through the same parsing
+    pipeline as a synchronisation, without calling the Vend API. Returns
+    True if any objects were created.
+    """
+    if manager.json_collection_name is None:
+        objects = data
+    elif isinstance(data, dict):
+        objects = data.get(manager.json_collection_name)
+    else:
+        objects = None
+
+    if isinstance(objects, list):
+        return manager.parse_collection(retailer, objects)
+    return manager.parse_object(
+        retailer, manager.get_inner_json(data, manager.json_object_name))
+
+
+payload_archive = PayloadArchive()
@@ -0,0 +1,47 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections
+from django.utils.module_loading import import_string
+
+from django_vend.core.utils import get_vend_setting
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=get_vend_setting('VEND_BACKGROUND_WORKERS'))
+    return _executor
+
+
+def _run(func, args, kwargs):
+    try:
+        return func(*args, **kwargs)
+    except Exception:
+        logger.exception('Background task %r failed', func)
+        raise
+    finally:
+        connections.close_all()
+
+
+def run_in_background(func, *args, **kwargs):
+    """
+    Run ``func`` off the request path.
+
+    If the VEND_BACKGROUND_RUNNER setting names a callable, it is called
+    with ``func`` and its arguments (e.g. to hand the work to a task queue);
+    otherwise ``func`` runs on a shared thread pool.
+    """
+    runner = get_vend_setting('VEND_BACKGROUND_RUNNER')
+    if runner:
+        return import_string(runner)(func, *args, **kwargs)
+    return get_executor().submit(_run, func, args, kwargs)
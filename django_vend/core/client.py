@@ -0,0 +1,496 @@
+import hashlib
+import random
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from django.core.cache import caches
+
+from django_vend.core.exceptions import VendCircuitOpenError
+from django_vend.core.stats import record_sync_stats
+from django_vend.core.utils import get_vend_setting, parse_date
+
+_local = threading.local()
+
+
+@contextmanager
+def interactive_requests(interactive=True):
+    """
+    Give the API requests made by the current thread within the block
+    priority over background requests, e.g. while serving a view.
+    """
+    previous = getattr(_local, 'interactive', False)
+    _local.interactive = interactive
+    try:
+        yield
+    finally:
+        _local.interactive = previous
+
+
+def is_interactive():
+    return getattr(_local, 'interactive', False)
+
+
+def parse_retry_after(value, now=None):
+    """
+    Return the number of seconds to wait given a ``Retry-After`` header,
+    which may be a number of seconds or a date, or None if it is invalid.
+    """
+    now = now or time.time()
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        pass
+    else:
+        # Large numbers are Unix timestamps rather than durations
+        if seconds > 10 ** 9:
+            seconds -= now
+        return max(seconds, 0)
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        date = None
+    if date is None:
+        try:
+            date = parse_date(value)
+        except (ValueError, OverflowError):
+            return None
+    if date is None or date.tzinfo is None:
+        return None
+    return max(date.timestamp() - now, 0)
+
+
+class TokenBucket(object):
+    """
+    Allows ``rate`` requests per second on average, in bursts of up to
+    ``capacity``.
+
+    The last ``reserve`` tokens are kept for interactive requests, and
+    background requests wait while any interactive ones are waiting.
+    """
+
+    def __init__(self, rate, capacity, reserve=0):
+        self.rate = rate
+        self.capacity = capacity
+        self.reserve = reserve
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0
+        self.interactive_waiting = 0
+        self._condition = threading.Condition()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, interactive=False, timeout=None):
+        """
+        Take a token, waiting for up to ``timeout`` seconds (or indefinitely)
+        for one to be available. Returns False if none was.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            if interactive:
+                self.interactive_waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    floor = 0 if interactive else self.reserve
+                    waiting_for_others = (not interactive and
+                                          self.interactive_waiting)
+                    if (now >= self.blocked_until and not waiting_for_others
+                            and self.tokens >= floor + 1):
+                        self.tokens -= 1
+                        return True
+
+                    wait = max(self.blocked_until - now,
+                               (floor + 1 - self.tokens) / self.rate)
+                    if deadline is not None:
+                        if now >= deadline:
+                            return False
+                        wait = min(wait, deadline - now)
+                    self._condition.wait(wait)
+            finally:
+                if interactive:
+                    self.interactive_waiting -= 1
+                    self._condition.notify_all()
+
+    def block(self, seconds):
+        """
+        Take no tokens for ``seconds``, e.g. after being rate limited.
+        """
+        with self._condition:
+            self.blocked_until = max(self.blocked_until,
+                                     time.monotonic() + seconds)
+
+    def limit(self, remaining):
+        """
+        Take no more than ``remaining`` tokens, as reported by the server.
+        """
+        with self._condition:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, remaining)
+
+
+class RateLimitScheduler(object):
+    """
+    Schedules API requests through a TokenBucket per domain (i.e. per
+    retailer), sized by the VEND_RATE_LIMIT_REQUESTS and
+    VEND_RATE_LIMIT_PERIOD settings and adjusted by the rate limit headers of
+    each response.
+    """
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def create_bucket(self):
+        requests_allowed = get_vend_setting('VEND_RATE_LIMIT_REQUESTS')
+        period = get_vend_setting('VEND_RATE_LIMIT_PERIOD')
+        reserve = get_vend_setting('VEND_RATE_LIMIT_INTERACTIVE_RESERVE')
+        return TokenBucket(requests_allowed / period, requests_allowed,
+                           reserve=int(requests_allowed * reserve))
+
+    def get_bucket(self, domain):
+        with self._lock:
+            bucket = self._buckets.get(domain)
+            if bucket is None:
+                bucket = self._buckets[domain] = self.create_bucket()
+        return bucket
+
+    def acquire(self, domain, timeout=None):
+        return self.get_bucket(domain).acquire(is_interactive(), timeout)
+
+    def get_retry_after(self, response):
+        """
+        Return the number of seconds to wait before retrying a rate limited
+        ``response``.
+        """
+        headers = response.headers
+        retry_after = parse_retry_after(headers.get('Retry-After'))
+        if retry_after is None:
+            retry_after = parse_retry_after(headers.get('X-RateLimit-Reset'))
+        if retry_after is None:
+            retry_after = (get_vend_setting('VEND_RATE_LIMIT_PERIOD') /
+                           get_vend_setting('VEND_RATE_LIMIT_REQUESTS'))
+        return retry_after
+
+    def record(self, domain, response):
+        """
+        Update the bucket for ``domain`` from a response's status and
+        headers. Returns the seconds to wait before retrying if the response
+        was rate limited, otherwise None.
+        """
+        bucket = self.get_bucket(domain)
+        if response.status_code == 429:
+            retry_after = self.get_retry_after(response)
+            bucket.block(retry_after)
+            return retry_after
+
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        try:
+            remaining = int(remaining)
+        except (TypeError, ValueError):
+            return None
+        bucket.limit(remaining)
+        if remaining <= 0:
+            reset = parse_retry_after(response.headers.get('X-RateLimit-Reset'))
+            if reset:
+                bucket.block(reset)
+        return None
+
+
+class CircuitBreaker(object):
+    """
+    Fails fast after ``failure_threshold`` consecutive failed requests.
+
+    Once ``reset_timeout`` seconds have passed, a single trial request is let
+    through (the breaker is half open); it closes the breaker if it succeeds
+    and opens it again if it fails.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if (self.state == self.OPEN and
+                    time.monotonic() - self.opened_at >= self.reset_timeout):
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if (self.state == self.HALF_OPEN or
+                    self.failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'failures': self.failures,
+                'retries': self.retries,
+            }
+
+
+class VendSessionPool(object):
+    """
+    Keep-alive ``requests`` sessions shared between requests and threads,
+    keyed by the domain being called (one per retailer for the Vend API).
+    """
+
+    def __init__(self, pool_size=None, connect_timeout=None,
+                 read_timeout=None, scheduler=None):
+        self._pool_size = pool_size
+        self._connect_timeout = connect_timeout
+        self._read_timeout = read_timeout
+        self._sessions = {}
+        self._breakers = {}
+        self._lock = threading.Lock()
+        self.scheduler = scheduler or RateLimitScheduler()
+
+    @property
+    def pool_size(self):
+        return self._pool_size or get_vend_setting('VEND_HTTP_POOL_SIZE')
+
+    @property
+    def timeout(self):
+        return (
+            self._connect_timeout or
+                get_vend_setting('VEND_HTTP_CONNECT_TIMEOUT'),
+            self._read_timeout or get_vend_setting('VEND_HTTP_READ_TIMEOUT'),
+        )
+
+    def create_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def get_session(self, domain):
+        session = self._sessions.get(domain)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(domain)
+                if session is None:
+                    session = self.create_session()
+                    self._sessions[domain] = session
+        return session
+
+    def get_breaker(self, domain):
+        with self._lock:
+            breaker = self._breakers.get(domain)
+            if breaker is None:
+                breaker = self._breakers[domain] = CircuitBreaker(
+                    get_vend_setting('VEND_CIRCUIT_FAILURE_THRESHOLD'),
+                    get_vend_setting('VEND_CIRCUIT_RESET_TIMEOUT'))
+        return breaker
+
+    def get_backoff(self, attempt):
+        """
+        Return the seconds to wait before retry number ``attempt`` (from 0):
+        a random time up to an exponentially growing cap ("full jitter").
+        """
+        cap = min(get_vend_setting('VEND_HTTP_BACKOFF_MAX'),
+                  get_vend_setting('VEND_HTTP_BACKOFF_BASE') * 2 ** attempt)
+        return random.uniform(0, cap)
+
+    def is_transient(self, response):
+        return response.status_code >= 500
+
+    def get(self, url, **kwargs):
+        """
+        Make a GET request once the rate limit allows it, or after waiting
+        VEND_RATE_LIMIT_MAX_WAIT seconds for it to, leaving the server to
+        decide (counted in the ``rate_limit_timeouts`` SyncStats).
+
+        Rate limited requests are retried after the time asked for by the
+        server, up to VEND_RATE_LIMIT_RETRIES times and as long as that is no
+        more than VEND_RATE_LIMIT_MAX_WAIT seconds; otherwise the 429 response
+        is returned. Connection errors, timeouts and 5xx responses are
+        retried up to VEND_HTTP_RETRIES times with backoff, after which they
+        count as a failure for the domain's CircuitBreaker. While the breaker
+        is open, VendCircuitOpenError is raised without making a request.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        domain = urlsplit(url).netloc
+        breaker = self.get_breaker(domain)
+        if not breaker.allow():
+            raise VendCircuitOpenError(
+                'Vend API requests to {} are failing'.format(domain))
+
+        session = self.get_session(domain)
+        max_wait = get_vend_setting('VEND_RATE_LIMIT_MAX_WAIT')
+        rate_limit_retries = get_vend_setting('VEND_RATE_LIMIT_RETRIES')
+        retries = get_vend_setting('VEND_HTTP_RETRIES')
+        rate_limited = attempt = 0
+
+        while True:
+            if not self.scheduler.acquire(domain, timeout=max_wait):
+                record_sync_stats(rate_limit_timeouts=1)
+            try:
+                response = session.get(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                response, error = None, e
+            except requests.RequestException:
+                breaker.record_failure()
+                raise
+            else:
+                error = None
+                retry_after = self.scheduler.record(domain, response)
+                if retry_after is not None:
+                    if (retry_after > max_wait or
+                            rate_limited >= rate_limit_retries):
+                        # Vend is up, just busy
+                        breaker.record_success()
+                        return response
+                    rate_limited += 1
+                    response.close()
+                    continue
+                if not self.is_transient(response):
+                    breaker.record_success()
+                    return response
+
+            if attempt >= retries:
+                breaker.record_failure()
+                if error is not None:
+                    raise error
+                return response
+            if response is not None:
+                response.close()
+            breaker.record_retry()
+            record_sync_stats(retries=1)
+            time.sleep(self.get_backoff(attempt))
+            attempt += 1
+
+    def get_health(self):
+        """
+        Return a dict of domain to the state, consecutive failures and
+        retries of its CircuitBreaker.
+        """
+        with self._lock:
+            breakers = list(self._breakers.items())
+        return {domain: breaker.get_stats() for domain, breaker in breakers}
+
+    def get_stats(self):
+        """
+        Return a dict of domain to counts of connections opened and reused,
+        plus a ``total`` entry summing every domain.
+        """
+        with self._lock:
+            sessions = list(self._sessions.items())
+
+        stats = {}
+        total = {'opened': 0, 'reused': 0}
+        for domain, session in sessions:
+            opened = requests_made = 0
+            for adapter in set(session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools.get(key)
+                    if pool is not None:
+                        opened += pool.num_connections
+                        requests_made += pool.num_requests
+            stats[domain] = {
+                'opened': opened,
+                'reused': max(requests_made - opened, 0),
+            }
+            total['opened'] += stats[domain]['opened']
+            total['reused'] += stats[domain]['reused']
+        stats['total'] = total
+        return stats
+
+    def close(self):
+        with self._lock:
+            sessions, self._sessions = self._sessions, {}
+            self._breakers = {}
+        for session in sessions.values():
+            session.close()
+
+
+class ResponseCache(object):
+    """
+    Remembers the validators (``ETag`` and ``Last-Modified``) and a digest
+    of the body of the last response for each retailer and URL, in the
+    Django cache named by VEND_RESPONSE_CACHE (disabled by default).
+
+    The cache backend bounds its size: a local memory cache evicts the least
+    recently used entries beyond its MAX_ENTRIES option.
+    """
+    key_prefix = 'django_vend:response:'
+
+    def get_cache(self):
+        alias = get_vend_setting('VEND_RESPONSE_CACHE')
+        return caches[alias] if alias else None
+
+    def is_enabled(self):
+        return bool(get_vend_setting('VEND_RESPONSE_CACHE'))
+
+    def make_key(self, retailer, url, params=None):
+        key = '{}:{}:{}'.format(retailer.pk, url,
+                                sorted((params or {}).items()))
+        return self.key_prefix + hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def get(self, retailer, url, params=None):
+        cache = self.get_cache()
+        if cache is None:
+            return None
+        return cache.get(self.make_key(retailer, url, params))
+
+    def set(self, retailer, url, params, entry):
+        cache = self.get_cache()
+        if cache is not None:
+            cache.set(self.make_key(retailer, url, params), entry,
+                      get_vend_setting('VEND_RESPONSE_CACHE_TIMEOUT'))
+
+    def get_conditional_headers(self, entry):
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def make_entry(self, response):
+        return {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'digest': hashlib.sha1(response.content).hexdigest(),
+        }
+
+
+session_pool = VendSessionPool()
+response_cache = ResponseCache()
@@ -4,3 +4,9 @@ class VendError(Exception):
 class VendSyncError(VendError):
     pass
 
+
+class VendRateLimitError(VendSyncError):
+    pass
+
+class VendCircuitOpenError(VendSyncError):
+    pass
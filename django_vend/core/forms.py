@@ -4,16 +4,18 @@ from django import forms
 from django.utils.dateparse import parse_datetime
 from django.core.exceptions import ValidationError
 
+VALID_DATE_RE = re.compile(
+    "^(?:[1-9]\d{3}-(?:(?:0[1-9]|1[0-2])-(?:0[1-9]|1\d|2[0-8])|(?:0[13"
+    "-9]|1[0-2])-(?:29|30)|(?:0[13578]|1[02])-31)|(?:[1-9]\d(?:0[48]|["
+    "2468][048]|[13579][26])|(?:[2468][048]|[13579][26])00)-02-29)T(?:"
+    "[01]\d|2[0-3]):[0-5]\d:[0-5]\d(?:Z|[+-][01]\d:[0-5]\d)$")
+
 def valid_date(date):
-    regex = ("^(?:[1-9]\d{3}-(?:(?:0[1-9]|1[0-2])-(?:0[1-9]|1\d|2[0-8])|(?:0[13"
-             "-9]|1[0-2])-(?:29|30)|(?:0[13578]|1[02])-31)|(?:[1-9]\d(?:0[48]|["
-             "2468][048]|[13579][26])|(?:[2468][048]|[13579][26])00)-02-29)T(?:"
-             "[01]\d|2[0-3]):[0-5]\d:[0-5]\d(?:Z|[+-][01]\d:[0-5]\d)$")
-    return re.search(regex, date)
+    return VALID_DATE_RE.search(date)
 
 class VendDateTimeField(forms.DateTimeField):
     def to_python(self, value):
-        if value not in self.empty_values and valid_date(value):
+        if isinstance(value, str) and valid_date(value):
             try:
                 value = parse_datetime(value)
             except ValueError:
@@ -21,3 +23,15 @@ class VendDateTimeField(forms.DateTimeField):
         elif value == "null":
             value = None
         return super(VendDateTimeField, self).to_python(value)
+
+
+class VendModelFormMixin(object):
+    """
+    For model forms of data retrieved from Vend: saving clears the
+    fingerprint of the instance, so that the next synchronisation rewrites it
+    from Vend even if Vend's data has not changed.
+    """
+    def save(self, commit=True):
+        if hasattr(self.instance, 'fingerprint'):
+            self.instance.fingerprint = ''
+        return super(VendModelFormMixin, self).save(commit)
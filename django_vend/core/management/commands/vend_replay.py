@@ -0,0 +1,94 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from django_vend.core.archive import PayloadArchive, replay_payload
+from django_vend.core.exceptions import VendError
+from django_vend.core.stats import collect_sync_stats
+from django_vend.core.sync import get_sync_managers
+
+
+class Command(BaseCommand):
+    help = ('Save archived Vend API responses again through the sync '
+            'pipeline, without calling the Vend API.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'resources', nargs='*', metavar='resource',
+            help='Resources to replay (default: all)')
+        parser.add_argument(
+            '-r', '--retailer', action='append', dest='retailers',
+            metavar='NAME', help='Only replay this retailer (repeatable)')
+        parser.add_argument(
+            '-d', '--archive-dir',
+            help='Archive directory (default: VEND_API_ARCHIVE_DIR)')
+        parser.add_argument(
+            '--rollback', action='store_true',
+            help='Roll back each payload after saving it, e.g. to repeat a '
+                 'benchmark from the same state')
+
+    def handle(self, *args, **options):
+        from django_vend.auth.models import VendRetailer
+
+        archive = PayloadArchive(options['archive_dir'])
+        if not archive.is_enabled():
+            raise CommandError('No archive directory given and '
+                               'VEND_API_ARCHIVE_DIR is not set')
+
+        managers = get_sync_managers()
+        unknown = set(options['resources']) - set(managers)
+        if unknown:
+            raise CommandError('Unknown resource(s): {}. Choose from: {}'.format(
+                ', '.join(sorted(unknown)), ', '.join(sorted(managers))))
+
+        try:
+            payloads = archive.iter_payloads(options['retailers'],
+                                             options['resources'])
+        except FileNotFoundError:
+            raise CommandError('Archive directory {} does not exist'.format(
+                archive.root))
+
+        retailers = {}
+        replayed = failed = 0
+        start = time.monotonic()
+        with collect_sync_stats() as stats:
+            for payload in payloads:
+                manager = managers.get(payload.resource)
+                if manager is None:
+                    continue
+                if payload.retailer_name not in retailers:
+                    retailers[payload.retailer_name] = \
+                        VendRetailer.objects.filter(
+                            name=payload.retailer_name).first()
+                retailer = retailers[payload.retailer_name]
+                if retailer is None:
+                    self.stderr.write('{}: unknown retailer {}'.format(
+                        payload.path, payload.retailer_name))
+                    failed += 1
+                    continue
+
+                try:
+                    with transaction.atomic():
+                        replay_payload(manager, retailer, payload.load())
+                        if options['rollback']:
+                            transaction.set_rollback(True)
+                except (VendError, ValueError, OSError, EOFError) as e:
+                    self.stderr.write('{}: failed ({})'.format(
+                        payload.path, e))
+                    failed += 1
+                    continue
+                replayed += 1
+                if options['verbosity'] > 1:
+                    self.stdout.write('{}: replayed'.format(payload.path))
+        elapsed = time.monotonic() - start
+
+        self.stdout.write(
+            'Replayed {} payload(s): {} objects in {:.2f}s '
+            '({:.1f} objects/s), {} DB writes, {} skipped'.format(
+                replayed, stats.objects, elapsed,
+                stats.objects / elapsed if elapsed else 0,
+                stats.db_writes, stats.skipped))
+
+        if failed:
+            raise CommandError('{} payload(s) failed'.format(failed))
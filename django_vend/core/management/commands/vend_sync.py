@@ -0,0 +1,122 @@
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import django
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from django_vend.core.exceptions import VendError
+from django_vend.core.stats import SyncStats, collect_sync_stats
+from django_vend.core.sync import get_sync_managers, sync_run
+
+logger = logging.getLogger(__name__)
+
+
+def init_worker():
+    # Worker processes started with "spawn" need Django set up again
+    if not apps.ready:
+        django.setup()
+
+
+def sync_retailer(retailer_pk, resources, full=False):
+    """
+    Synchronise ``resources``, and any stale dependencies, for a single
+    retailer. Returns the retailer's name, the collected SyncStats and an
+    error message or None.
+    """
+    from django_vend.auth.models import VendRetailer
+
+    retailer = VendRetailer.objects.get(pk=retailer_pk)
+    error = None
+    with collect_sync_stats() as stats, sync_run(retailer) as run:
+        try:
+            run.synchronise(resources, full=full)
+        except VendError as e:
+            error = str(e)
+        except Exception as e:
+            # Carry on with the other retailers
+            logger.exception('Could not synchronise %s', retailer.name)
+            error = str(e) or repr(e)
+    connections.close_all()
+    return retailer.name, stats, error
+
+
+class Command(BaseCommand):
+    help = 'Synchronise data from the Vend API for some or all retailers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'resources', nargs='*', metavar='resource',
+            help='Resources to synchronise (default: all)')
+        parser.add_argument(
+            '-r', '--retailer', action='append', dest='retailers',
+            metavar='NAME', help='Only synchronise this retailer (repeatable)')
+        parser.add_argument(
+            '-w', '--workers', type=int, default=4,
+            help='Number of retailers to synchronise concurrently')
+        parser.add_argument(
+            '--processes', action='store_true',
+            help='Use a process pool instead of a thread pool')
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Retrieve whole collections rather than changes since the '
+                 'last synchronisation, marking missing objects deleted')
+
+    def handle(self, *args, **options):
+        from django_vend.auth.models import VendRetailer
+
+        managers = get_sync_managers()
+        resources = options['resources'] or sorted(managers)
+        unknown = set(resources) - set(managers)
+        if unknown:
+            raise CommandError('Unknown resource(s): {}. Choose from: {}'.format(
+                ', '.join(sorted(unknown)), ', '.join(sorted(managers))))
+
+        retailers = VendRetailer.objects.order_by('name')
+        if options['retailers']:
+            retailers = retailers.filter(name__in=options['retailers'])
+        retailer_pks = list(retailers.values_list('pk', flat=True))
+
+        if options['processes']:
+            # Child processes must open their own database connections
+            connections.close_all()
+            executor = ProcessPoolExecutor(max_workers=options['workers'],
+                                           initializer=init_worker)
+        else:
+            executor = ThreadPoolExecutor(max_workers=options['workers'])
+
+        self.stdout.write('Synchronising {} for {} retailer(s)'.format(
+            ', '.join(resources), len(retailer_pks)))
+
+        total = SyncStats()
+        failed = 0
+        start = time.monotonic()
+        with executor:
+            futures = [executor.submit(sync_retailer, pk, resources,
+                                       options['full'])
+                       for pk in retailer_pks]
+            for future in futures:
+                name, stats, error = future.result()
+                total.update(stats)
+                if error:
+                    failed += 1
+                    self.stderr.write('{}: failed ({})'.format(name, error))
+                elif options['verbosity'] > 1:
+                    self.stdout.write('{}: {} objects'.format(
+                        name, stats.objects))
+        elapsed = time.monotonic() - start
+
+        self.stdout.write(
+            'Synchronised {} objects in {:.2f}s ({:.1f} objects/s), '
+            '{} API calls, {} retries, {} rate limit timeouts, '
+            '{} DB writes, {} skipped'.format(
+                total.objects, elapsed,
+                total.objects / elapsed if elapsed else 0,
+                total.api_calls, total.retries, total.rate_limit_timeouts,
+                total.db_writes, total.skipped))
+
+        if failed:
+            raise CommandError('{} of {} retailer(s) failed'.format(
+                failed, len(retailer_pks)))
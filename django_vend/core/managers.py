@@ -1,29 +1,143 @@
-from django.db import models
+import hashlib
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from datetime import timedelta
+from itertools import islice
+
+from django.apps import apps
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, models, transaction
 from django.utils import timezone
 
 import requests
 
-from django_vend.core.exceptions import VendSyncError
+from django_vend.core.archive import payload_archive
+from django_vend.core.background import run_in_background
+from django_vend.core.client import (interactive_requests, is_interactive,
+                                     response_cache, session_pool)
+from django_vend.core.exceptions import (VendError, VendRateLimitError,
+                                         VendSyncError)
+from django_vend.core.models import VendSyncCheckpoint, VendSyncState
+from django_vend.core.singleflight import single_flight
+from django_vend.core.stats import collect_sync_stats, record_sync_stats
+from django_vend.core.streaming import JSONArrayStream
+from django_vend.core.sync import get_sync_run, sync_run
+from django_vend.core.upsert import get_upsert_backend
+from django_vend.core.utils import get_vend_setting
+
+logger = logging.getLogger(__name__)
+
+# SyncStats counts kept by VendSyncCheckpoint, and the fields they are kept in
+CHECKPOINT_STATS = {
+    'api_calls': 'api_calls',
+    'objects': 'objects_retrieved',
+    'db_writes': 'db_writes',
+    'skipped': 'skipped',
+}
+
+REFRESH_KEY_PREFIX = 'django_vend:refresh:'
+# Pending refreshes, when VEND_SYNC_LOCK_CACHE is disabled
+_pending_refreshes = set()
+_pending_refreshes_lock = threading.Lock()
+
+
+def _get_refresh_key(retailer_pk, model_label, object_id=None):
+    return '{}{}:{}:{}'.format(REFRESH_KEY_PREFIX, retailer_pk, model_label,
+                               object_id or '')
+
+
+def _claim_refresh(key):
+    """
+    Record a pending background refresh, returning False if there already
+    is one. Pending refreshes are shared through the VEND_SYNC_LOCK_CACHE
+    cache, so that they are seen by every process.
+    """
+    cache = single_flight.get_cache()
+    if cache is not None:
+        return cache.add(key, True,
+                         get_vend_setting('VEND_SYNC_LOCK_TIMEOUT'))
+    with _pending_refreshes_lock:
+        if key in _pending_refreshes:
+            return False
+        _pending_refreshes.add(key)
+        return True
+
+
+def _release_refresh(key):
+    cache = single_flight.get_cache()
+    if cache is not None:
+        cache.delete(key)
+    else:
+        with _pending_refreshes_lock:
+            _pending_refreshes.discard(key)
+
+
+def refresh_stale(retailer_pk, model_label, object_id=None):
+    """
+    Synchronise data found stale by synchronise_if_stale, unless another
+    synchronisation made it fresh while this one was queued. Takes only
+    picklable arguments, so that it can be handed to a task queue by
+    VEND_BACKGROUND_RUNNER.
+    """
+    from django_vend.auth.models import VendRetailer
+
+    try:
+        retailer = VendRetailer.objects.get(pk=retailer_pk)
+        manager = apps.get_model(model_label)._default_manager
+        if not manager.is_fresh(retailer, object_id):
+            if object_id is None:
+                manager.synchronise(retailer)
+            else:
+                manager.synchronise(retailer, object_id)
+    finally:
+        _release_refresh(
+            _get_refresh_key(retailer_pk, model_label, object_id))
 
 
 class AbstractVendAPISingleObjectManager(models.Manager):
     def synchronise(self, retailer, object_id):
-        return self._retrieve_object_from_api(retailer, object_id)
+        return self._synchronise_once(
+            retailer, object_id, self._retrieve_object_from_api)
 
 class AbstractVendAPICollectionManager(models.Manager):
-    def synchronise(self, retailer):
-        return self._retrieve_collection_from_api(retailer)
+    def synchronise(self, retailer, full=False):
+        return self._synchronise_once(
+            retailer, None, self._retrieve_collection_from_api, full=full)
 
 class AbstractVendAPIManager(models.Manager):
-    def synchronise(self, retailer, object_id=None):
+    def synchronise(self, retailer, object_id=None, full=False):
         if object_id:
-            return self._retrieve_object_from_api(retailer, object_id)
+            return self._synchronise_once(
+                retailer, object_id, self._retrieve_object_from_api)
         else:
-            return self._retrieve_collection_from_api(retailer)
+            return self._synchronise_once(
+                retailer, None, self._retrieve_collection_from_api, full=full)
 
 class VendAPIManagerMixin(object):
 
     sync_exception = VendSyncError
+    session_pool = session_pool
+    freshness = None
+    # Name used for the resource in settings, sync state and vend_sync
+    resource_name = None
+    # Names of the resources that must be synchronised before this one
+    depends_on = ()
+    # Map of field name to the Vend model (or its label) whose uid the
+    # parsed field value holds, resolved to a pk before saving
+    related_fields = {}
+    # FieldMapping used to parse Vend API objects into field values
+    field_mapping = None
+    # Types of Vend webhook whose payload is an object to synchronise
+    webhook_events = ()
+    # Update the retrieved time of objects that are unchanged since the last
+    # synchronisation
+    track_last_seen = True
+    bulk_batch_size = None
+    # Unique fields identifying an object, for database-native upserts
+    upsert_conflict_fields = ('uid',)
 
     def get_dict_value(self, dict_obj, key, exception=None, required=True):
         if exception is None:
@@ -35,26 +149,78 @@ class VendAPIManagerMixin(object):
 
         return value
 
-    def _retrieve_from_api(self, retailer, url):
+    def _request(self, retailer, url, params=None, headers=None,
+                 stream=False):
         exception = self.sync_exception
 
-        headers = {
+        request_headers = {
             'Authorization': 'Bearer {}'.format(retailer.access_token),
             'Content-Type': 'application/json',
             'Accept': 'application/json',
         }
+        request_headers.update(headers or {})
+        record_sync_stats(api_calls=1)
         try:
-            result = requests.get(url, headers=headers)
+            result = self.session_pool.get(url, params=params,
+                                           headers=request_headers,
+                                           stream=stream)
         except requests.exceptions.RequestException as e:
             raise exception(e)
-        if result.status_code != requests.codes.ok:
+        if stream and result.status_code != requests.codes.ok:
+            # Release the connection of a streamed response
+            result.close()
+        if result.status_code == requests.codes.too_many_requests:
+            raise VendRateLimitError(
+                'Rate limited by Vend API for {}'.format(retailer.name))
+        if result.status_code not in (requests.codes.ok,
+                                      requests.codes.not_modified):
             raise exception(
                 'Received {} status from Vend API'.format(result.status_code))
+        if (not stream and result.status_code == requests.codes.ok and
+                payload_archive.is_enabled()):
+            payload_archive.save(retailer, self.get_resource_name(),
+                                 result.content)
+        return result
+
+    def _decode(self, result):
         try:
-            data = result.json()
+            return result.json()
         except ValueError as e:
-            raise exception(e)
-        return data
+            raise self.sync_exception(e)
+
+    def _retrieve_from_api(self, retailer, url, params=None):
+        return self._decode(self._request(retailer, url, params))
+
+    @contextmanager
+    def _retrieve_if_modified(self, retailer, url, params=None,
+                              force=False):
+        """
+        Yield the data at ``url``, or None if it is unchanged since it was
+        last retrieved (according to the response cache), in which case it
+        need not be parsed or saved again.
+
+        The response is only recorded in the cache if the block completes,
+        so that data that failed to save is retrieved again next time.
+        """
+        if not response_cache.is_enabled():
+            yield self._retrieve_from_api(retailer, url, params)
+            return
+
+        entry = None if force else response_cache.get(retailer, url, params)
+        result = self._request(retailer, url, params,
+                               response_cache.get_conditional_headers(entry))
+        if result.status_code == requests.codes.not_modified:
+            record_sync_stats(unchanged_responses=1)
+            yield None
+            return
+
+        new_entry = response_cache.make_entry(result)
+        if entry is not None and entry['digest'] == new_entry['digest']:
+            record_sync_stats(unchanged_responses=1)
+            yield None
+        else:
+            yield self._decode(result)
+        response_cache.set(retailer, url, params, new_entry)
 
     def get_inner_json(self, obj, container_name):
         inner = None
@@ -63,7 +229,265 @@ class VendAPIManagerMixin(object):
                 inner = obj[container_name]
             except KeyError as e:
                 raise self.sync_exception(e)
-        return inner or obj
+        return obj if inner is None else inner
+
+    def to_uid(self, value):
+        try:
+            return self.model._meta.get_field('uid').to_python(value)
+        except ValidationError as e:
+            raise self.sync_exception(e)
+
+    def get_uid_map(self, uids, retailer=None):
+        """
+        Return a dict of uid to pk for the objects with the given ``uids``,
+        loaded in a single query.
+        """
+        queryset = self.filter(uid__in=[self.to_uid(uid) for uid in uids])
+        if retailer is not None:
+            queryset = queryset.filter(retailer=retailer)
+        return dict(queryset.values_list('uid', 'pk'))
+
+    def resolve_related(self, retailer, rows):
+        """
+        Replace the related object uids in ``rows``, a list of dicts of field
+        values, with pks. Each related model is queried once for all rows.
+        """
+        for name, model in self.related_fields.items():
+            if isinstance(model, str):
+                model = apps.get_model(model)
+            related = model._default_manager
+            attname = self.model._meta.get_field(name).attname
+
+            uids = set(related.to_uid(row[name]) for row in rows
+                       if row.get(name) is not None)
+            run = get_sync_run(retailer)
+            if run is not None and uids:
+                run.synchronise_references(related, uids)
+            uid_map = related.get_uid_map(uids, retailer) if uids else {}
+
+            for row in rows:
+                if name not in row:
+                    continue
+                uid = row[name]
+                if uid is None:
+                    row[attname] = None
+                else:
+                    try:
+                        row[attname] = uid_map[related.to_uid(uid)]
+                    except KeyError:
+                        raise self.sync_exception(
+                            'Invalid uid {} for {}'.format(
+                                uid, model.__name__))
+                del row[name]
+
+    def get_fingerprint(self, defaults):
+        """
+        Return a digest of the parsed field values of an object, used to skip
+        writing objects that have not changed.
+        """
+        values = {key: value for key, value in defaults.items()
+                  if key not in ('retailer', 'retrieved', 'fingerprint')}
+        content = json.dumps(values, sort_keys=True, default=str)
+        return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+    def touch(self, pks, retrieved, batch_size=None):
+        """
+        Record that the objects with the given ``pks`` were seen unchanged.
+        """
+        if not self.track_last_seen:
+            return
+        pks = list(pks)
+        batch_size = batch_size or len(pks)
+        for i in range(0, len(pks), batch_size):
+            self.filter(pk__in=pks[i:i + batch_size]).update(
+                retrieved=retrieved)
+
+    def get_bulk_batch_size(self):
+        return (self.bulk_batch_size or
+                get_vend_setting('VEND_SYNC_BULK_BATCH_SIZE'))
+
+    def bulk_upsert(self, retailer, rows):
+        """
+        Save ``rows``, a dict of ``uid`` to field values, for ``retailer``.
+
+        Existing objects are loaded in a single query. New objects and those
+        whose fingerprint has changed are written by the upsert backend for
+        the database (see core.upsert), and those left unchanged only have
+        their retrieved time updated. Returns True if any objects were
+        created.
+        """
+        if not rows:
+            return False
+
+        uid_field = self.model._meta.get_field('uid')
+        retrieved = timezone.now()
+        batch_size = self.get_bulk_batch_size()
+
+        existing = {
+            obj.uid: obj for obj in
+            self.filter(retailer=retailer, uid__in=list(rows.keys()))
+        }
+
+        to_write = []
+        unchanged = []
+        update_fields = set(['retrieved', 'fingerprint'])
+        for uid, defaults in rows.items():
+            fingerprint = self.get_fingerprint(defaults)
+            obj = existing.get(uid_field.to_python(uid))
+            if obj is None:
+                obj = self.model(uid=uid, retailer=retailer)
+            elif obj.fingerprint == fingerprint:
+                unchanged.append(obj.pk)
+                continue
+            for key, value in defaults.items():
+                setattr(obj, key, value)
+            obj.fingerprint = fingerprint
+            obj.retrieved = retrieved
+            update_fields.update(defaults)
+            to_write.append(obj)
+
+        created = updated = 0
+        if to_write:
+            backend = get_upsert_backend(self.db)
+            created, updated = backend.upsert(
+                self, to_write, sorted(update_fields),
+                self.upsert_conflict_fields, batch_size)
+        if unchanged:
+            self.touch(unchanged, retrieved, batch_size)
+        record_sync_stats(objects=len(rows), db_writes=created + updated)
+
+        return bool(created)
+
+    def save_rows(self, retailer, rows, on_error=None):
+        """
+        Resolve the related objects of ``rows``, a dict of ``uid`` to field
+        values, and save them in a transaction. Returns True if any objects
+        were created.
+
+        If ``on_error`` is given, objects that cannot be resolved or saved
+        are passed to it with the error and left out, and the rest are
+        saved; otherwise the first error is raised.
+        """
+        try:
+            self.resolve_related(retailer, list(rows.values()))
+        except self.sync_exception:
+            if on_error is None:
+                raise
+            for uid, row in list(rows.items()):
+                try:
+                    self.resolve_related(retailer, [row])
+                except self.sync_exception as e:
+                    del rows[uid]
+                    on_error(uid, e)
+
+        try:
+            with transaction.atomic(using=self.db):
+                return self.bulk_upsert(retailer, rows)
+        except DatabaseError:
+            if on_error is None:
+                raise
+
+        # Write the objects again one at a time, each in a savepoint, leaving
+        # out those the database rejects
+        created = False
+        with transaction.atomic(using=self.db):
+            for uid, row in rows.items():
+                try:
+                    with transaction.atomic(using=self.db):
+                        created = self.bulk_upsert(
+                            retailer, {uid: row}) or created
+                except DatabaseError as e:
+                    on_error(uid, e)
+        return created
+
+    def get_resource_name(self):
+        return self.resource_name or self.model._meta.label_lower
+
+    def _synchronise_once(self, retailer, object_id, func, **kwargs):
+        """
+        Call ``func`` unless the same object or collection is already being
+        synchronised for ``retailer``, in which case wait for that instead.
+        """
+        key = '{}:{}:{}'.format(
+            retailer.pk, self.get_resource_name(), object_id or '')
+        if kwargs.get('full'):
+            # An incremental synchronisation is no substitute for a full one
+            key += ':full'
+        args = (retailer,) if object_id is None else (retailer, object_id)
+        with sync_run(retailer) as run:
+            result = single_flight.do(key, func, *args, **kwargs)
+            run.mark_synchronised(self, object_id)
+        return result
+
+    def get_freshness(self):
+        """
+        Return the number of seconds synchronised data is considered fresh
+        for, from the VEND_SYNC_FRESHNESS setting or the manager's
+        ``freshness`` attribute. 0 means data is never fresh.
+        """
+        freshness = get_vend_setting('VEND_SYNC_FRESHNESS') or {}
+        return freshness.get(self.get_resource_name(), self.freshness) or 0
+
+    def is_fresh(self, retailer, object_id=None):
+        freshness = self.get_freshness()
+        if not freshness:
+            return False
+        cutoff = timezone.now() - timedelta(seconds=freshness)
+
+        if object_id is not None:
+            return self.filter(retailer=retailer, uid=object_id,
+                               retrieved__gte=cutoff).exists()
+        return VendSyncState.objects.filter(
+            retailer=retailer, resource=self.get_resource_name(),
+            synchronised__gte=cutoff).exists()
+
+    def get_stale_uids(self, retailer, uids):
+        """
+        Return the subset of ``uids`` whose objects are outside their
+        freshness window.
+        """
+        freshness = self.get_freshness()
+        if not freshness:
+            return set(uids)
+        cutoff = timezone.now() - timedelta(seconds=freshness)
+        return set(self.filter(retailer=retailer, uid__in=uids,
+                               retrieved__lt=cutoff)
+                       .values_list('uid', flat=True))
+
+    def has_local_data(self, retailer, object_id=None):
+        queryset = self.filter(retailer=retailer)
+        if object_id is not None:
+            queryset = queryset.filter(uid=object_id)
+        return queryset.exists()
+
+    def synchronise_if_stale(self, retailer, object_id=None, force=False,
+                             background=False):
+        """
+        Synchronise unless the data is still within its freshness window, or
+        ``force`` is True. Returns True if any objects were created.
+
+        If ``background`` is True and there is already local data, stale data
+        is refreshed in the background and False is returned immediately,
+        unless the refresh is forced. Only one background refresh of the same
+        data is pending at a time.
+        """
+        if not force and self.is_fresh(retailer, object_id):
+            return False
+        if (background and not force and
+                self.has_local_data(retailer, object_id)):
+            label = self.model._meta.label
+            key = _get_refresh_key(retailer.pk, label, object_id)
+            if _claim_refresh(key):
+                try:
+                    run_in_background(refresh_stale, retailer.pk, label,
+                                      object_id)
+                except Exception:
+                    _release_refresh(key)
+                    raise
+            return False
+        if object_id is None:
+            return self.synchronise(retailer)
+        return self.synchronise(retailer, object_id)
 
 
 class VendAPISingleObjectManagerMixin(VendAPIManagerMixin):
@@ -72,15 +496,85 @@ class VendAPISingleObjectManagerMixin(VendAPIManagerMixin):
     json_object_name = None
 
     def _retrieve_object_from_api(self, retailer, object_id, defaults=None):
-        # Call API
+        url = self.resource_object_url.format(retailer.name, object_id)
+        with self._retrieve_if_modified(retailer, url) as data:
+            if data is None:
+                self.touch(self.filter(retailer=retailer, uid=object_id)
+                               .values_list('pk', flat=True), timezone.now())
+                return False
+            data = self.get_inner_json(data, self.json_object_name)
+            return self.parse_object(retailer, data, defaults)
+
+    def synchronise_many(self, retailer, object_ids, max_workers=None):
+        """
+        Synchronise the objects with the given ``object_ids``, fetching them
+        concurrently (at most ``max_workers`` or VEND_SYNC_FETCH_WORKERS at a
+        time) and saving them in one batch.
+
+        Returns whether any objects were created, and a dict of object id to
+        the error that prevented that object being synchronised.
+        """
+        object_ids = list(dict.fromkeys(str(i) for i in object_ids))
+        if not object_ids:
+            return False, {}
+        workers = max_workers or get_vend_setting('VEND_SYNC_FETCH_WORKERS')
+        interactive = is_interactive()
+
+        def fetch(object_id):
+            # Stats are recorded per thread, so collect the pool thread's
+            # to add to this one's
+            with interactive_requests(interactive), \
+                    collect_sync_stats() as stats:
+                try:
+                    return self._fetch_object(retailer, object_id), None, stats
+                except VendError as e:
+                    return None, e, stats
+
+        with ThreadPoolExecutor(
+                max_workers=min(workers, len(object_ids))) as executor:
+            futures = [(object_id, executor.submit(fetch, object_id))
+                       for object_id in object_ids]
+
+        errors = {}
+        rows = {}
+        object_id_map = {}
+        for object_id, future in futures:
+            data, error, stats = future.result()
+            record_sync_stats(**stats.as_dict())
+            if error is not None:
+                errors[object_id] = error
+                continue
+            try:
+                uid = self.get_dict_value(data, 'id')
+                self.to_uid(uid)
+                rows[uid] = self.parse_json_object(data)
+                object_id_map[uid] = object_id
+            except VendError as e:
+                errors[object_id] = e
+            except (TypeError, ValueError) as e:
+                errors[object_id] = self.sync_exception(e)
+
+        failed = set()
+
+        def on_error(uid, error):
+            failed.add(uid)
+            errors[object_id_map[uid]] = error
+
+        with sync_run(retailer) as run:
+            created = self.save_rows(retailer, rows, on_error)
+            for uid in rows:
+                if uid not in failed:
+                    run.mark_synchronised(self, uid)
+        return created, errors
+
+    def _fetch_object(self, retailer, object_id):
         url = self.resource_object_url.format(retailer.name, object_id)
         data = self._retrieve_from_api(retailer, url)
-
-        data = self.get_inner_json(data, self.json_object_name)
-
-        return self.parse_object(retailer, data, defaults)
+        return self.get_inner_json(data, self.json_object_name)
 
     def parse_json_object(self, json_obj):
+        if self.field_mapping is not None:
+            return self.field_mapping.map(json_obj, self.sync_exception)
         raise NotImplementedError('parse_json_object method must be '
                                   'implemented by {}'.format(
                                       self.__class__.__name__))
@@ -94,46 +588,376 @@ class VendAPISingleObjectManagerMixin(VendAPIManagerMixin):
             for key in additional_defaults:
                 defaults[key] = additional_defaults[key]
 
+        self.resolve_related(retailer, [defaults])
         defaults['retrieved'] = timezone.now()
-
-        obj, created = self.update_or_create(uid=uid, defaults=defaults)
+        defaults['fingerprint'] = self.get_fingerprint(defaults)
+
+        existing = self.filter(retailer=retailer, uid=uid) \
+                       .values_list('pk', 'fingerprint').first()
+        if existing is not None and existing[1] == defaults['fingerprint']:
+            self.touch([existing[0]], defaults['retrieved'])
+            record_sync_stats(objects=1)
+            return False
+
+        obj, created = self.update_or_create(
+            retailer=retailer, uid=uid, defaults=defaults)
+        record_sync_stats(objects=1, db_writes=1)
         return created
 
 class VendAPICollectionManagerMixin(VendAPIManagerMixin):
 
     resource_collection_url = None
     json_collection_name = None
-
-    def _retrieve_collection_from_api(self, retailer):
+    # Number of objects saved per transaction
+    commit_every = None
+    # Skip objects that cannot be parsed or saved rather than failing
+    skip_invalid = None
+    versioned = False
+    page_size = None
+    # Decode collections one object at a time as the response arrives
+    streaming = None
+    stream_chunk_size = 64 * 1024
+
+    def _retrieve_collection_from_api(self, retailer, full=False):
         # Call API
         url = self.resource_collection_url.format(retailer.name)
-        data = self._retrieve_from_api(retailer, url)
+        if self.versioned:
+            created = self._retrieve_versioned_collection_from_api(
+                retailer, url, full)
+        else:
+            checkpoint = self.start_checkpoint(retailer, full=True)
+            with self._record_checkpoint(checkpoint) as save_checkpoint:
+                created = self._retrieve_whole_collection_from_api(
+                    retailer, url, full)
+                save_checkpoint(pages=1)
+
+        VendSyncState.objects.update_or_create(
+            retailer=retailer, resource=self.get_resource_name(),
+            defaults={'synchronised': timezone.now()})
+        return created
+
+    @contextmanager
+    def _retrieve_collection_page(self, retailer, url, params=None,
+                                  force=False):
+        """
+        Yield the data of a page of the collection at ``url`` (a dict of its
+        other members) and an iterable of its objects, or None if it is
+        unchanged since it was last retrieved.
+
+        In streaming mode the objects are decoded as they are iterated, and
+        the data is only complete once they have all been read.
+        """
+        if not self.get_streaming():
+            with self._retrieve_if_modified(retailer, url, params,
+                                            force) as data:
+                if data is None:
+                    yield None
+                else:
+                    yield data, self.get_inner_json(
+                        data, self.json_collection_name)
+            return
+
+        result = self._request(retailer, url, params, stream=True)
+        with closing(result):
+            chunks = payload_archive.tee(
+                retailer, self.get_resource_name(),
+                result.iter_content(self.stream_chunk_size))
+            objects = JSONArrayStream(chunks, self.json_collection_name)
+            yield objects.meta, self._read_stream(objects)
+
+    def _read_stream(self, objects):
+        """
+        Yield the objects of a streamed response, raising errors reading or
+        decoding it as the sync exception, as _decode does for whole ones.
+        """
+        try:
+            for obj in objects:
+                yield obj
+        except (ValueError, requests.RequestException) as e:
+            raise self.sync_exception(e)
+
+    def _retrieve_whole_collection_from_api(self, retailer, url, full=False):
+        """
+        Retrieve the whole collection, unless it is unchanged since it was
+        last retrieved, and reconcile it with the stored objects.
+        """
+        with self._retrieve_collection_page(retailer, url,
+                                            force=full) as page:
+            if page is None:
+                self.touch(self.filter(retailer=retailer)
+                               .values_list('pk', flat=True), timezone.now(),
+                           self.get_bulk_batch_size())
+                return False
+
+            data, objects = page
+            seen = set()
+            created = self.parse_collection(retailer, objects, seen)
+            self.reconcile(retailer, seen)
+        return created
+
+    def _retrieve_versioned_collection_from_api(self, retailer, url,
+                                                full=False):
+        """
+        Retrieve only the objects changed since the last synchronisation (or
+        all of them if ``full`` is True), one page at a time, advancing the
+        stored version and checkpoint after each page. Objects missing from
+        a whole collection are reconciled.
+
+        An interrupted retrieval of the whole collection is resumed from its
+        last completed page. Returns whether any objects were created.
+        """
+        state, state_created = VendSyncState.objects.get_or_create(
+            retailer=retailer, resource=self.get_resource_name())
+        checkpoint = None if full else self.get_interrupted_checkpoint(retailer)
+        if checkpoint is not None:
+            state.version = checkpoint.version
+            checkpoint.attempts += 1
+        else:
+            if full:
+                state.version = 0
+            checkpoint = self.start_checkpoint(
+                retailer, full=state.version == 0, version=state.version)
+        resumed = checkpoint.attempts > 1
+        force = full or resumed
+        page_size = self.get_page_size()
+        seen = set()
+        created = False
+        # Whether the last page was reached
+        complete = False
+
+        with self._record_checkpoint(checkpoint) as save_checkpoint:
+            save_checkpoint(status=VendSyncCheckpoint.RUNNING, error='')
+            while True:
+                params = {'after': state.version, 'page_size': page_size}
+                page = {'count': 0, 'version': None}
+                with self._retrieve_collection_page(retailer, url, params,
+                                                    force=force) as result:
+                    if result is None:
+                        break
+                    data, objects = result
+                    created = self.parse_collection(
+                        retailer, self._track_page(objects, page),
+                        seen) or created
+                    if not page['count']:
+                        complete = True
+                        break
+
+                    version = self.get_collection_version(
+                        data, page['version'])
+                    if version is not None and version > state.version:
+                        state.version = version
+                        with transaction.atomic():
+                            state.save(update_fields=['version'])
+                            save_checkpoint(version=version,
+                                            pages=checkpoint.pages + 1)
+                    elif page['count'] >= page_size:
+                        # The next page cannot be asked for
+                        break
+
+                if page['count'] < page_size:
+                    complete = True
+                    break
+
+            if complete and checkpoint.full:
+                if not resumed:
+                    self.reconcile(retailer, seen)
+                elif self.track_last_seen:
+                    # The objects seen before the interruption are only known
+                    # by their retrieved time
+                    self.reconcile(retailer,
+                                   retrieved_before=checkpoint.started)
+
+        return created
 
-        data = self.get_inner_json(data, self.json_collection_name)
+    def start_checkpoint(self, retailer, full=False, version=0):
+        now = timezone.now()
+        return VendSyncCheckpoint.objects.create(
+            retailer=retailer, resource=self.get_resource_name(), full=full,
+            version=version, started=now, updated=now)
+
+    def get_interrupted_checkpoint(self, retailer):
+        """
+        Return the checkpoint of the retailer's latest synchronisation if it
+        was retrieving the whole collection and stopped after saving some of
+        its pages, otherwise None.
+        """
+        checkpoint = VendSyncCheckpoint.objects.filter(
+            retailer=retailer, resource=self.get_resource_name()).first()
+        if (checkpoint is not None and checkpoint.full and checkpoint.pages and
+                checkpoint.status != VendSyncCheckpoint.COMPLETED):
+            return checkpoint
+        return None
+
+    @contextmanager
+    def _record_checkpoint(self, checkpoint):
+        """
+        Yield a function saving ``checkpoint`` with the given field values and
+        the SyncStats recorded so far. The checkpoint is marked completed when
+        the block completes, or failed if it raises an exception.
+        """
+        counts = {field: getattr(checkpoint, field)
+                  for field in CHECKPOINT_STATS.values()}
+
+        with collect_sync_stats() as stats:
+            def save_checkpoint(**values):
+                for name, field in CHECKPOINT_STATS.items():
+                    values[field] = counts[field] + getattr(stats, name)
+                values['updated'] = timezone.now()
+                for field, value in values.items():
+                    setattr(checkpoint, field, value)
+                checkpoint.save()
 
-        # Save to DB & Return saved objects
-        return self.parse_collection(retailer, data)
+            try:
+                yield save_checkpoint
+            except Exception as e:
+                try:
+                    save_checkpoint(status=VendSyncCheckpoint.FAILED,
+                                    error=str(e) or repr(e),
+                                    finished=timezone.now())
+                except DatabaseError:
+                    logger.exception('Could not save the checkpoint of %s',
+                                     checkpoint)
+                raise
+            save_checkpoint(status=VendSyncCheckpoint.COMPLETED,
+                            finished=timezone.now())
+        self.prune_checkpoints(checkpoint.retailer)
+
+    def prune_checkpoints(self, retailer):
+        """
+        Delete all but the latest VEND_SYNC_CHECKPOINT_RETENTION completed
+        checkpoints of the retailer (None keeps them all), and the failed
+        ones a later run completed after.
+        """
+        keep = get_vend_setting('VEND_SYNC_CHECKPOINT_RETENTION')
+        if keep is None:
+            return
+        checkpoints = VendSyncCheckpoint.objects.filter(
+            retailer=retailer, resource=self.get_resource_name())
+        completed = list(checkpoints.filter(
+            status=VendSyncCheckpoint.COMPLETED).values_list(
+                'pk', 'started'))
+        if not completed:
+            return
+        stale = [pk for pk, started in completed[keep:]]
+        stale.extend(checkpoints.filter(
+            status=VendSyncCheckpoint.FAILED,
+            started__lt=completed[0][1]).values_list('pk', flat=True))
+        if stale:
+            VendSyncCheckpoint.objects.filter(pk__in=stale).delete()
+
+    def reconcile(self, retailer, seen=(), retrieved_before=None):
+        """
+        Mark the retailer's objects whose uids were not ``seen`` in a complete
+        collection as deleted, or those last retrieved before
+        ``retrieved_before`` if given. Returns the number of objects marked.
+        """
+        if not self.has_field('deleted_at'):
+            return 0
+        stored = self.filter(retailer=retailer, deleted_at__isnull=True)
+        if retrieved_before is not None:
+            missing = list(stored.filter(retrieved__lt=retrieved_before)
+                                 .values_list('pk', flat=True))
+        else:
+            seen = set(self.to_uid(uid) for uid in seen)
+            missing = [pk for uid, pk in stored.values_list('uid', 'pk')
+                       if uid not in seen]
+        if missing:
+            values = {'deleted_at': timezone.now()}
+            if self.has_field('fingerprint'):
+                # Rewrite the object in full if it reappears
+                values['fingerprint'] = ''
+            self.filter(pk__in=missing).update(**values)
+            record_sync_stats(db_writes=len(missing))
+        return len(missing)
+
+    def has_field(self, name):
+        return any(field.name == name
+                   for field in self.model._meta.concrete_fields)
+
+    def get_page_size(self):
+        return self.page_size or get_vend_setting('VEND_SYNC_PAGE_SIZE')
+
+    def get_collection_version(self, data, max_version=None):
+        """
+        Return the highest version included in a page of results, preferring
+        the ``version`` range Vend returns alongside the collection to the
+        highest ``max_version`` of its objects.
+        """
+        version = data.get('version') if isinstance(data, dict) else None
+        if isinstance(version, dict) and version.get('max') is not None:
+            return int(version['max'])
+        return max_version
+
+    def _track_page(self, objects, page):
+        """
+        Yield ``objects``, counting them and recording their highest version
+        in the dict ``page``.
+        """
+        for obj in objects:
+            page['count'] += 1
+            version = obj.get('version') if isinstance(obj, dict) else None
+            if version is not None:
+                page['version'] = max(page['version'] or 0, int(version))
+            yield obj
+
+    def get_streaming(self):
+        if self.streaming is not None:
+            return self.streaming
+        return get_vend_setting('VEND_SYNC_STREAMING')
 
     def parse_json_collection_object(self, json_obj):
         raise NotImplementedError('parse_json_collection_object method must be '
                                   'implemented by {}'.format(
                                       self.__class__.__name__))
 
-    def parse_collection(self, retailer, result):
+    def parse_collection(self, retailer, result, seen=None):
+        """
+        Save the objects in ``result``, committing a transaction every
+        ``get_commit_every()`` objects, and adding their uids to ``seen`` if
+        given. Returns True if any were created.
+        """
         created = False
-
-        for object_stub in result:
-            uid = self.get_dict_value(object_stub, 'id')
-
-            defaults = self.parse_json_collection_object(object_stub)
-            defaults['retailer'] = retailer
-            defaults['retrieved'] = timezone.now()
-
-            obj, created_ = self.update_or_create(uid=uid, defaults=defaults)
-            created = created or created_
-
+        result = iter(result)
+        commit_every = self.get_commit_every()
+        while True:
+            chunk = list(islice(result, commit_every))
+            if not chunk:
+                break
+            created = self.parse_collection_chunk(
+                retailer, chunk, seen) or created
         return created
 
+    def parse_collection_chunk(self, retailer, chunk, seen=None):
+        skip_invalid = self.get_skip_invalid()
+        rows = {}
+        for object_stub in chunk:
+            try:
+                uid = self.get_dict_value(object_stub, 'id')
+                self.to_uid(uid)
+                if seen is not None:
+                    seen.add(uid)
+                rows[uid] = self.parse_json_collection_object(object_stub)
+            except self.sync_exception as e:
+                if not skip_invalid:
+                    raise
+                self.skip_object(object_stub.get('id'), e)
+
+        on_error = self.skip_object if skip_invalid else None
+        return self.save_rows(retailer, rows, on_error)
+
+    def skip_object(self, uid, error):
+        logger.warning('Skipped %s %s: %s', self.get_resource_name(), uid,
+                       error)
+        record_sync_stats(skipped=1)
+
+    def get_commit_every(self):
+        return self.commit_every or get_vend_setting('VEND_SYNC_COMMIT_EVERY')
+
+    def get_skip_invalid(self):
+        if self.skip_invalid is not None:
+            return self.skip_invalid
+        return get_vend_setting('VEND_SYNC_SKIP_INVALID')
+
 class BaseVendAPIManager(AbstractVendAPIManager,
                          VendAPICollectionManagerMixin,
                          VendAPISingleObjectManagerMixin):
@@ -0,0 +1,81 @@
+from django_vend.core.exceptions import VendSyncError
+
+
+class VendField(object):
+    """
+    Maps the ``source`` key of a Vend API object to the ``target`` model field
+    (``source`` by default), converting the value with ``converter`` if given.
+
+    A required field must be present and not None or an empty string. A
+    missing optional field is set to ``default``.
+    """
+
+    def __init__(self, source, target=None, required=True, converter=None,
+                 default=None):
+        self.source = source
+        self.target = target or source
+        self.required = required
+        self.converter = converter
+        self.default = default
+
+
+class FieldMapping(object):
+    """
+    A declarative mapping of Vend API objects to model field values.
+    """
+
+    def __init__(self, *fields):
+        self.fields = fields
+        # Unpacked once, so that mapping a row is a plain loop over tuples
+        self._fields = [(field.source, field.target, field.converter,
+                         field.required, field.default) for field in fields]
+
+    def map(self, obj, exception=VendSyncError):
+        """
+        Return a dict of field values for ``obj``, raising ``exception`` if
+        any required fields are missing.
+        """
+        row = {}
+        missing = []
+        get = obj.get
+        for source, target, converter, required, default in self._fields:
+            value = get(source)
+            if value is None or (required and value == ''):
+                if required:
+                    missing.append(source)
+                else:
+                    row[target] = default
+            elif converter is None:
+                row[target] = value
+            else:
+                try:
+                    row[target] = converter(value)
+                except (TypeError, ValueError, OverflowError) as e:
+                    raise exception('Invalid {} {!r}: {}'.format(
+                        source, value, e))
+        if missing:
+            raise exception('dict_obj does not contain key(s) {}'.format(
+                ', '.join(missing)))
+        return row
+
+    def map_partial(self, obj):
+        """
+        Return a dict of field values for the keys present in ``obj``,
+        leaving missing fields out (e.g. for validation by a form).
+        """
+        row = {}
+        get = obj.get
+        for source, target, converter, required, default in self._fields:
+            value = get(source)
+            if value is None or (required and value == ''):
+                if not required and source in obj:
+                    row[target] = default
+            elif converter is None:
+                row[target] = value
+            else:
+                # Leave invalid values out, for the form to report
+                try:
+                    row[target] = converter(value)
+                except (TypeError, ValueError, OverflowError):
+                    pass
+        return row
@@ -0,0 +1,28 @@
+# Generated by Django 2.2.28 on 2026-10-17 14:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('vend_auth', '0009_venduser_retrieved'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VendSyncState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resource', models.CharField(max_length=256)),
+                ('version', models.BigIntegerField(default=0)),
+                ('retailer', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, to='vend_auth.VendRetailer')),
+            ],
+            options={
+                'unique_together': {('retailer', 'resource')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-17 14:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vend_core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vendsyncstate',
+            name='synchronised',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
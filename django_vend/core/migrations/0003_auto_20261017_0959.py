@@ -0,0 +1,47 @@
+# Generated by Django 2.2.28 on 2026-10-17 14:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vend_auth', '0013_auto_20261017_1448'),
+        ('vend_core', '0002_vendsyncstate_synchronised'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VendSyncCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resource', models.CharField(max_length=256)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='running', max_length=16)),
+                ('full', models.BooleanField(default=False)),
+                ('version', models.BigIntegerField(default=0)),
+                ('pages', models.PositiveIntegerField(default=0)),
+                ('api_calls', models.PositiveIntegerField(default=0)),
+                ('objects_retrieved', models.PositiveIntegerField(default=0)),
+                ('db_writes', models.PositiveIntegerField(default=0)),
+                ('skipped', models.PositiveIntegerField(default=0)),
+                ('attempts', models.PositiveIntegerField(default=1)),
+                ('error', models.TextField(blank=True)),
+                ('started', models.DateTimeField()),
+                ('updated', models.DateTimeField()),
+                ('finished', models.DateTimeField(null=True)),
+                ('retailer', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, to='vend_auth.VendRetailer')),
+            ],
+            options={
+                'ordering': ('-started',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='vendsynccheckpoint',
+            index=models.Index(fields=['retailer', 'resource', '-started'], name='vend_core_v_retaile_101249_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vendsynccheckpoint',
+            index=models.Index(fields=['status', 'updated'], name='vend_core_v_status_3043a6_idx'),
+        ),
+    ]
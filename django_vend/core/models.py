@@ -1,3 +1,73 @@
 from django.db import models
 
-# Create your models here.
+
+class VendSyncState(models.Model):
+    """
+    Per-retailer synchronisation state for a resource retrieved from the Vend
+    API, such as the version high-water-mark of the last synced object.
+    """
+    retailer = models.ForeignKey('vend_auth.VendRetailer', editable=False,
+        on_delete=models.CASCADE)
+    resource = models.CharField(max_length=256)
+    version = models.BigIntegerField(default=0)
+    # time of the last completed collection synchronisation
+    synchronised = models.DateTimeField(null=True)
+
+    class Meta:
+        unique_together = ('retailer', 'resource')
+
+    def __str__(self):
+        return '{} {}'.format(self.retailer, self.resource)
+
+
+class VendSyncCheckpoint(models.Model):
+    """
+    A collection synchronisation run for a retailer and resource, updated as
+    each page is saved so that an interrupted run can resume from its last
+    completed page. Kept once finished as a history of synchronisations.
+    """
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (RUNNING, 'Running'),
+        (COMPLETED, 'Completed'),
+        (FAILED, 'Failed'),
+    )
+
+    retailer = models.ForeignKey('vend_auth.VendRetailer', editable=False,
+        on_delete=models.CASCADE)
+    resource = models.CharField(max_length=256)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES,
+                              default=RUNNING)
+    # whether the run retrieves the whole collection
+    full = models.BooleanField(default=False)
+    # version after the last completed page
+    version = models.BigIntegerField(default=0)
+    pages = models.PositiveIntegerField(default=0)
+    api_calls = models.PositiveIntegerField(default=0)
+    objects_retrieved = models.PositiveIntegerField(default=0)
+    db_writes = models.PositiveIntegerField(default=0)
+    skipped = models.PositiveIntegerField(default=0)
+    # number of times the run was started or resumed
+    attempts = models.PositiveIntegerField(default=1)
+    error = models.TextField(blank=True)
+    started = models.DateTimeField()
+    # time of the last completed page
+    updated = models.DateTimeField()
+    finished = models.DateTimeField(null=True)
+
+    class Meta:
+        ordering = ('-started',)
+        indexes = [
+            models.Index(fields=['retailer', 'resource', '-started']),
+            models.Index(fields=['status', 'updated']),
+        ]
+
+    def __str__(self):
+        return '{} {} {} ({})'.format(
+            self.retailer, self.resource, self.started, self.status)
+
+    @property
+    def duration(self):
+        return (self.finished or self.updated) - self.started
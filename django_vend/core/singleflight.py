@@ -0,0 +1,101 @@
+import threading
+import time
+from uuid import uuid4
+
+from django.core.cache import caches
+
+from django_vend.core.utils import get_vend_setting
+
+
+class _Call(object):
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Run at most one call per key at a time.
+
+    Callers in the same process that arrive while a call is in flight wait
+    for it and share its result. Across processes a lock is held in the
+    cache named by VEND_SYNC_LOCK_CACHE; callers that find it held wait for
+    it to be released and then return None without making the call. After a
+    call completes, further calls for the key are skipped for
+    VEND_SYNC_SINGLE_FLIGHT_WINDOW seconds.
+    """
+    key_prefix = 'django_vend:singleflight:'
+    done = 'done'
+    poll_interval = 0.1
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def get_cache(self):
+        alias = get_vend_setting('VEND_SYNC_LOCK_CACHE')
+        return caches[alias] if alias else None
+
+    def do(self, key, func, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._do_locked(key, func, args, kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+    def _do_locked(self, key, func, args, kwargs):
+        cache = self.get_cache()
+        if cache is None:
+            return func(*args, **kwargs)
+
+        cache_key = self.key_prefix + key
+        timeout = get_vend_setting('VEND_SYNC_LOCK_TIMEOUT')
+        token = uuid4().hex
+        if not cache.add(cache_key, token, timeout):
+            if self._wait(cache, cache_key, timeout):
+                return None
+            # The lock outlived its timeout; take it over
+            cache.set(cache_key, token, timeout)
+
+        try:
+            return func(*args, **kwargs)
+        finally:
+            window = get_vend_setting('VEND_SYNC_SINGLE_FLIGHT_WINDOW')
+            if window:
+                cache.set(cache_key, self.done, window)
+            elif cache.get(cache_key) == token:
+                cache.delete(cache_key)
+
+    def _wait(self, cache, cache_key, timeout):
+        """
+        Wait for another process to release the lock. Returns False if it is
+        still held after ``timeout`` seconds.
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            value = cache.get(cache_key)
+            if value is None or value == self.done:
+                return True
+            time.sleep(self.poll_interval)
+        return False
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,50 @@
+import threading
+from contextlib import contextmanager
+
+_local = threading.local()
+
+
+class SyncStats(object):
+    """
+    Counts of the work done while synchronising with the Vend API.
+    """
+    fields = ('api_calls', 'objects', 'db_writes', 'skipped', 'retries',
+              'unchanged_responses', 'rate_limit_timeouts')
+
+    def __init__(self, **counts):
+        for field in self.fields:
+            setattr(self, field, counts.get(field, 0))
+
+    def add(self, **counts):
+        for field, count in counts.items():
+            setattr(self, field, getattr(self, field) + count)
+
+    def update(self, other):
+        self.add(**other.as_dict())
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.fields}
+
+    def __repr__(self):
+        return 'SyncStats({})'.format(', '.join(
+            '{}={}'.format(k, v) for k, v in sorted(self.as_dict().items())))
+
+
+@contextmanager
+def collect_sync_stats():
+    """
+    Collect the SyncStats recorded by the current thread within the block.
+    """
+    stats = SyncStats()
+    if not hasattr(_local, 'collectors'):
+        _local.collectors = []
+    _local.collectors.append(stats)
+    try:
+        yield stats
+    finally:
+        _local.collectors.remove(stats)
+
+
+def record_sync_stats(**counts):
+    for stats in getattr(_local, 'collectors', ()):
+        stats.add(**counts)
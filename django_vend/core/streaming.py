@@ -0,0 +1,116 @@
+import codecs
+import json
+
+WHITESPACE = ' \t\n\r'
+
+
+class JSONArrayStream(object):
+    """
+    Iterates over the items of the array held by ``key`` in a JSON object
+    read from ``chunks`` (an iterable of bytes, such as
+    ``Response.iter_content()``), decoding one item at a time so that only
+    the current item and a chunk of text are held in memory.
+
+    The object's other members are decoded whole into ``meta``, and the
+    number of items read so far is kept in ``count``.
+    """
+
+    def __init__(self, chunks, key):
+        self.chunks = iter(chunks)
+        self.key = key
+        self.meta = {}
+        self.count = 0
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+
+    def _read(self):
+        """
+        Append the next chunk to the buffer, dropping what has been decoded.
+        Returns False at the end of the stream.
+        """
+        if self._eof:
+            return False
+        try:
+            chunk = next(self.chunks)
+        except StopIteration:
+            self._eof = True
+            self._buffer = (self._buffer[self._pos:] +
+                            self._text.decode(b'', final=True))
+        else:
+            self._buffer = self._buffer[self._pos:] + self._text.decode(chunk)
+        self._pos = 0
+        return True
+
+    def _peek(self):
+        """
+        Skip whitespace and return the next character, or '' at the end.
+        """
+        while True:
+            while (self._pos < len(self._buffer) and
+                   self._buffer[self._pos] in WHITESPACE):
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._read():
+                return ''
+
+    def _expect(self, chars):
+        char = self._peek()
+        if not char or char not in chars:
+            raise ValueError('Expected {!r} at {!r}'.format(
+                chars, self._buffer[self._pos:self._pos + 20]))
+        self._pos += 1
+        return char
+
+    def _value(self):
+        """
+        Decode the next complete JSON value.
+        """
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except ValueError:
+                if not self._read():
+                    raise
+                continue
+            # A number at the end of the buffer may continue in the next
+            # chunk
+            if end == len(self._buffer) and not self._eof:
+                self._read()
+                continue
+            self._pos = end
+            return value
+
+    def __iter__(self):
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+        else:
+            yield from self._members()
+        # Read to the end of the stream
+        if self._peek():
+            raise ValueError('Extra data at {!r}'.format(
+                self._buffer[self._pos:self._pos + 20]))
+
+    def _members(self):
+        while True:
+            key = self._value()
+            self._expect(':')
+            if key == self.key and self._peek() == '[':
+                self._pos += 1
+                if self._peek() == ']':
+                    self._pos += 1
+                else:
+                    while True:
+                        self.count += 1
+                        yield self._value()
+                        if self._expect(',]') == ']':
+                            break
+            else:
+                self.meta[key] = self._value()
+            if self._expect(',}') == '}':
+                return
@@ -0,0 +1,158 @@
+import threading
+from contextlib import contextmanager
+
+from django.apps import apps
+
+from django_vend.core.utils import get_vend_setting
+
+_local = threading.local()
+
+
+def get_sync_managers():
+    """
+    Return a dict of resource name to manager for every installed model whose
+    collection can be synchronised from the Vend API.
+    """
+    from django_vend.core.managers import VendAPICollectionManagerMixin
+
+    managers = {}
+    for model in apps.get_models():
+        manager = model._default_manager
+        if isinstance(manager, VendAPICollectionManagerMixin):
+            managers[manager.get_resource_name()] = manager
+    return managers
+
+
+def order_resources(names, managers, include_dependencies=False):
+    """
+    Return ``names`` ordered so that each resource comes after the resources
+    it depends on, optionally adding those dependencies if missing.
+    """
+    names = list(names)
+    ordered = []
+    visiting = set()
+
+    def visit(name):
+        if name in ordered:
+            return
+        if name in visiting:
+            raise ValueError('Circular dependency on {}'.format(name))
+        visiting.add(name)
+        for dependency in managers[name].depends_on:
+            if include_dependencies or dependency in names:
+                visit(dependency)
+        visiting.discard(name)
+        ordered.append(name)
+
+    for name in names:
+        visit(name)
+    return ordered
+
+
+class SyncRun(object):
+    """
+    A synchronisation run for a single retailer.
+
+    Dependencies between resources are resolved once per run, and each
+    dependency is synchronised at most once, and not at all while it is
+    still fresh.
+    """
+
+    def __init__(self, retailer, force=False):
+        self.retailer = retailer
+        self.force = force
+        self.managers = get_sync_managers()
+        # Resources whose collection, or individual objects, have been
+        # synchronised during this run
+        self.synchronised = set()
+        self.synchronised_objects = set()
+
+    def plan(self, resources):
+        return order_resources(resources, self.managers,
+                               include_dependencies=True)
+
+    def synchronise(self, resources, full=False):
+        """
+        Synchronise ``resources`` and any stale dependencies they have. If
+        ``full`` is True the requested resources are retrieved in full rather
+        than as changes since the last synchronisation.
+        """
+        for name in self.plan(resources):
+            manager = self.managers[name]
+            if name in resources:
+                manager.synchronise(self.retailer, full=full)
+            elif not self.is_fresh(manager):
+                manager.synchronise(self.retailer)
+
+    def is_fresh(self, manager):
+        if manager.get_resource_name() in self.synchronised:
+            return True
+        return not self.force and manager.is_fresh(self.retailer)
+
+    def mark_synchronised(self, manager, object_id=None):
+        name = manager.get_resource_name()
+        if object_id is None:
+            self.synchronised.add(name)
+        else:
+            self.synchronised_objects.add((name, manager.to_uid(object_id)))
+
+    def synchronise_references(self, manager, uids):
+        """
+        Make sure the objects of ``manager`` with the given ``uids``, which
+        are referenced by objects being synchronised, exist and are fresh.
+
+        An unknown uid refreshes the whole collection; otherwise only the
+        stale objects are synchronised, unless there are more of them than
+        VEND_SYNC_DEPENDENCY_FETCH_LIMIT.
+        """
+        name = manager.get_resource_name()
+        if name in self.synchronised:
+            return
+
+        known = set(manager.get_uid_map(uids, self.retailer))
+        if set(uids) - known:
+            manager.synchronise(self.retailer)
+            return
+
+        stale = set()
+        if self.force:
+            stale = known
+        elif known:
+            stale = manager.get_stale_uids(self.retailer, known)
+        stale = set(uid for uid in stale
+                    if (name, uid) not in self.synchronised_objects)
+
+        if len(stale) > get_vend_setting('VEND_SYNC_DEPENDENCY_FETCH_LIMIT'):
+            manager.synchronise(self.retailer)
+        else:
+            for uid in sorted(stale, key=str):
+                manager.synchronise(self.retailer, str(uid))
+
+
+def get_sync_run(retailer):
+    """
+    Return the SyncRun in progress for ``retailer`` in this thread, if any.
+    """
+    run = getattr(_local, 'run', None)
+    if run is not None and run.retailer.pk == retailer.pk:
+        return run
+    return None
+
+
+@contextmanager
+def sync_run(retailer, force=False):
+    """
+    Use the SyncRun in progress for ``retailer``, or start a new one for the
+    duration of the block.
+    """
+    run = get_sync_run(retailer)
+    if run is not None:
+        yield run
+        return
+
+    previous = getattr(_local, 'run', None)
+    _local.run = run = SyncRun(retailer, force=force)
+    try:
+        yield run
+    finally:
+        _local.run = previous
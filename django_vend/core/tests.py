@@ -1,8 +1,28 @@
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
+
 from django import forms
+from django.core.cache import cache
 from django.utils.dateparse import parse_datetime
 from django.test import TestCase
 
+import requests
+
+from .background import run_in_background
+from .client import (CircuitBreaker, TokenBucket, VendSessionPool,
+                     interactive_requests, parse_retry_after)
+from .exceptions import VendCircuitOpenError, VendSyncError
 from .forms import VendDateTimeField
+from .mapping import FieldMapping, VendField
+from .singleflight import SingleFlight
+from .stats import collect_sync_stats
+from .streaming import JSONArrayStream
+from .utils import parse_date
 
 
 class VendDateTimeForm(forms.Form):
@@ -43,3 +63,371 @@ class VendDateTimeFieldTestCase(TestCase):
     def test_null_date_not_required(self):
         form = VendOptionalDateTimeForm({'date': 'null'})
         self.assertTrue(form.is_valid())
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = b'{"data": []}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class VendSessionPoolTestCase(TestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.url = 'http://127.0.0.1:{}/api/2.0/outlets'.format(
+            self.server.server_port)
+        self.pool = VendSessionPool(pool_size=2)
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_session_reused(self):
+        domain = '127.0.0.1:{}'.format(self.server.server_port)
+        for i in range(3):
+            response = self.pool.get(self.url)
+            self.assertEqual(response.json(), {'data': []})
+
+        self.assertIs(self.pool.get_session(domain),
+                      self.pool.get_session(domain))
+        stats = self.pool.get_stats()
+        self.assertEqual(stats[domain], {'opened': 1, 'reused': 2})
+        self.assertEqual(stats['total'], {'opened': 1, 'reused': 2})
+
+
+class RateLimitTestCase(TestCase):
+
+    def fake_response(self, status_code, **headers):
+        return mock.Mock(status_code=status_code, headers=headers)
+
+    def test_background_leaves_reserve(self):
+        bucket = TokenBucket(rate=0.001, capacity=10, reserve=2)
+        for i in range(8):
+            self.assertTrue(bucket.acquire(timeout=0))
+        self.assertFalse(bucket.acquire(timeout=0))
+
+        self.assertTrue(bucket.acquire(interactive=True, timeout=0))
+        self.assertTrue(bucket.acquire(interactive=True, timeout=0))
+        self.assertFalse(bucket.acquire(interactive=True, timeout=0))
+
+    def test_background_waits_for_interactive(self):
+        bucket = TokenBucket(rate=0.001, capacity=10)
+        bucket.interactive_waiting = 1
+        self.assertFalse(bucket.acquire(timeout=0))
+        self.assertTrue(bucket.acquire(interactive=True, timeout=0))
+
+    def test_block(self):
+        bucket = TokenBucket(rate=100, capacity=10)
+        bucket.block(60)
+        self.assertFalse(bucket.acquire(interactive=True, timeout=0.01))
+
+    def test_parse_retry_after(self):
+        now = int(time.time())
+        self.assertEqual(parse_retry_after('5'), 5)
+        self.assertEqual(parse_retry_after(str(now + 10), now), 10)
+        self.assertAlmostEqual(
+            parse_retry_after(formatdate(now + 20, usegmt=True), now),
+            20, delta=1)
+        self.assertAlmostEqual(
+            parse_retry_after(
+                datetime.fromtimestamp(now + 30, timezone.utc).isoformat(),
+                now),
+            30, delta=1)
+        self.assertIsNone(parse_retry_after('soon'))
+        self.assertIsNone(parse_retry_after(None))
+
+    def test_retries_rate_limited_request(self):
+        pool = VendSessionPool()
+        session = mock.Mock()
+        session.get.side_effect = [
+            self.fake_response(429, **{'Retry-After': '0'}),
+            self.fake_response(200, **{'X-RateLimit-Remaining': '3'}),
+        ]
+        with mock.patch.object(pool, 'get_session', return_value=session):
+            response = pool.get('https://test.vendhq.com/api/2.0/outlets')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(session.get.call_count, 2)
+        bucket = pool.scheduler.get_bucket('test.vendhq.com')
+        self.assertLessEqual(bucket.tokens, 3)
+
+    def test_long_retry_after_returned(self):
+        pool = VendSessionPool()
+        session = mock.Mock()
+        session.get.return_value = self.fake_response(
+            429, **{'Retry-After': '3600'})
+        with mock.patch.object(pool, 'get_session', return_value=session):
+            response = pool.get('https://test.vendhq.com/api/2.0/outlets')
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(session.get.call_count, 1)
+        bucket = pool.scheduler.get_bucket('test.vendhq.com')
+        with interactive_requests():
+            self.assertFalse(pool.scheduler.acquire('test.vendhq.com',
+                                                    timeout=0))
+        self.assertGreater(bucket.blocked_until, time.monotonic())
+
+    def test_settings_disabled(self):
+        pool = VendSessionPool()
+        session = mock.Mock()
+        session.get.return_value = self.fake_response(
+            429, **{'Retry-After': '1'})
+        with self.settings(VEND_RATE_LIMIT_INTERACTIVE_RESERVE=0,
+                           VEND_RATE_LIMIT_MAX_WAIT=0,
+                           VEND_RATE_LIMIT_RETRIES=0), \
+                mock.patch.object(pool, 'get_session', return_value=session):
+            bucket = pool.scheduler.get_bucket('test.vendhq.com')
+            self.assertEqual(bucket.reserve, 0)
+            response = pool.get('https://test.vendhq.com/api/2.0/outlets')
+            self.assertEqual(response.status_code, 429)
+
+            # Blocked by the 429, the next request does not wait
+            session.get.return_value = self.fake_response(200)
+            with collect_sync_stats() as stats:
+                response = pool.get('https://test.vendhq.com/api/2.0/outlets')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(session.get.call_count, 2)
+        self.assertEqual(stats.rate_limit_timeouts, 1)
+
+
+class CircuitBreakerTestCase(TestCase):
+
+    url = 'https://test.vendhq.com/api/2.0/outlets'
+
+    def setUp(self):
+        self.pool = VendSessionPool()
+        self.session = mock.Mock()
+        mock.patch.object(self.pool, 'get_session',
+                          return_value=self.session).start()
+        mock.patch.object(self.pool, 'get_backoff', return_value=0).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def fake_response(self, status_code):
+        return mock.Mock(status_code=status_code, headers={})
+
+    def test_retries_transient_errors(self):
+        self.session.get.side_effect = [
+            self.fake_response(503),
+            requests.ConnectionError(),
+            self.fake_response(200),
+        ]
+        self.assertEqual(self.pool.get(self.url).status_code, 200)
+        self.assertEqual(self.session.get.call_count, 3)
+        self.assertEqual(self.pool.get_health()['test.vendhq.com'],
+                         {'state': 'closed', 'failures': 0, 'retries': 2})
+
+    def test_opens_after_failures(self):
+        self.session.get.return_value = self.fake_response(502)
+        with self.settings(VEND_CIRCUIT_FAILURE_THRESHOLD=2,
+                           VEND_HTTP_RETRIES=1):
+            self.assertEqual(self.pool.get(self.url).status_code, 502)
+            self.assertEqual(self.pool.get(self.url).status_code, 502)
+            with self.assertRaises(VendCircuitOpenError):
+                self.pool.get(self.url)
+
+        self.assertEqual(self.session.get.call_count, 4)
+        self.assertEqual(self.pool.get_health()['test.vendhq.com'],
+                         {'state': 'open', 'failures': 2, 'retries': 2})
+
+    def test_retries_disabled(self):
+        self.session.get.return_value = self.fake_response(503)
+        with self.settings(VEND_HTTP_RETRIES=0):
+            self.assertEqual(self.pool.get(self.url).status_code, 503)
+        self.assertEqual(self.session.get.call_count, 1)
+
+    def test_half_open(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        # Only one trial request is let through
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.allow())
+
+
+class RunInBackgroundTestCase(TestCase):
+
+    def test_thread_pool(self):
+        future = run_in_background(sum, [1, 2, 3])
+        self.assertEqual(future.result(timeout=5), 6)
+
+    def test_runner_setting(self):
+        runner = 'django_vend.core.tests.call_now'
+        with self.settings(VEND_BACKGROUND_RUNNER=runner):
+            self.assertEqual(run_in_background(sum, [1, 2]), ('ran', 3))
+
+def call_now(func, *args, **kwargs):
+    return ('ran', func(*args, **kwargs))
+
+
+class SingleFlightTestCase(TestCase):
+
+    def setUp(self):
+        self.single_flight = SingleFlight()
+        cache.clear()
+
+    def test_concurrent_calls_share_result(self):
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def func():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'result'
+
+        def call():
+            results.append(self.single_flight.do('key', func))
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=call) for i in range(3)]
+        for thread in followers:
+            thread.start()
+        release.set()
+        for thread in [leader] + followers:
+            thread.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['result'] * 4)
+        self.assertEqual(self.single_flight.do('key', lambda: 'again'),
+                         'again')
+
+    def test_locked_by_other_process(self):
+        cache_key = SingleFlight.key_prefix + 'key'
+        cache.set(cache_key, 'other process', 60)
+        threading.Timer(0.2, cache.delete, [cache_key]).start()
+
+        self.assertIsNone(self.single_flight.do('key', lambda: 'result'))
+
+    def test_window(self):
+        with self.settings(VEND_SYNC_SINGLE_FLIGHT_WINDOW=60):
+            self.assertEqual(self.single_flight.do('key', lambda: 1), 1)
+            self.assertIsNone(self.single_flight.do('key', lambda: 2))
+
+    def test_lock_cache_disabled(self):
+        cache.set(SingleFlight.key_prefix + 'key', 'other process', 60)
+        with self.settings(VEND_SYNC_LOCK_CACHE=None):
+            self.assertIsNone(self.single_flight.get_cache())
+            self.assertEqual(self.single_flight.do('key', lambda: 'result'),
+                             'result')
+
+
+class FieldMappingTestCase(TestCase):
+
+    mapping = FieldMapping(
+        VendField('name'),
+        VendField('display_prices', 'tax_inclusive',
+                  converter=lambda value: value == 'inclusive'),
+        VendField('prefix', required=False, default=''),
+    )
+
+    def test_map(self):
+        self.assertEqual(
+            self.mapping.map({'name': 'Main', 'display_prices': 'exclusive',
+                              'prefix': 'PRE', 'version': 1}),
+            {'name': 'Main', 'tax_inclusive': False, 'prefix': 'PRE'})
+        self.assertEqual(
+            self.mapping.map({'name': 'Main', 'display_prices': 'inclusive'}),
+            {'name': 'Main', 'tax_inclusive': True, 'prefix': ''})
+
+    def test_missing_required(self):
+        with self.assertRaisesMessage(VendSyncError, 'name, display_prices'):
+            self.mapping.map({'name': '', 'prefix': 'PRE'})
+
+    def test_map_partial(self):
+        self.assertEqual(self.mapping.map_partial({'name': ''}), {})
+        self.assertEqual(self.mapping.map_partial({'prefix': None}),
+                         {'prefix': ''})
+
+    def test_invalid_value(self):
+        mapping = FieldMapping(VendField('count', converter=int))
+        with self.assertRaisesMessage(VendSyncError, "Invalid count 'many'"):
+            mapping.map({'count': 'many'})
+        self.assertEqual(mapping.map_partial({'count': 'many'}), {})
+
+
+class ParseDateTestCase(TestCase):
+
+    def test_vend_formats(self):
+        self.assertEqual(
+            parse_date("2014-07-01T20:22:58+00:00"),
+            datetime(2014, 7, 1, 20, 22, 58, tzinfo=timezone.utc))
+        self.assertEqual(
+            parse_date("2015-03-16T22:21:50-05:30"),
+            datetime(2015, 3, 16, 22, 21, 50,
+                     tzinfo=timezone(-timedelta(hours=5, minutes=30))))
+        self.assertEqual(
+            parse_date("2014-07-01T20:22:58.25Z"),
+            datetime(2014, 7, 1, 20, 22, 58, 250000, tzinfo=timezone.utc))
+        self.assertEqual(parse_date("2013-06-12 03:59:54"),
+                         datetime(2013, 6, 12, 3, 59, 54))
+
+    def test_other_formats(self):
+        self.assertIsNone(parse_date("null"))
+        self.assertIsNone(parse_date(None))
+        self.assertEqual(parse_date("1 July 2014 20:22"),
+                         datetime(2014, 7, 1, 20, 22))
+
+
+class JSONArrayStreamTestCase(TestCase):
+
+    document = {
+        'version': {'min': 1, 'max': 10},
+        'data': [{'id': i, 'name': '\u00e9' * i, 'values': [1, 2.5, None]}
+                 for i in range(20)],
+        'after': 1234567,
+    }
+
+    def chunks(self, size):
+        content = json.dumps(self.document, ensure_ascii=False).encode('utf-8')
+        return (content[i:i + size] for i in range(0, len(content), size))
+
+    def test_chunk_sizes(self):
+        for size in (1, 3, 16, 4096):
+            stream = JSONArrayStream(self.chunks(size), 'data')
+            self.assertEqual(list(stream), self.document['data'])
+            self.assertEqual(stream.count, 20)
+            self.assertEqual(stream.meta, {'version': {'min': 1, 'max': 10},
+                                           'after': 1234567})
+
+    def test_empty(self):
+        self.assertEqual(list(JSONArrayStream([b'{"data": []}'], 'data')), [])
+        self.assertEqual(list(JSONArrayStream([b'{}'], 'data')), [])
+
+    def test_truncated(self):
+        with self.assertRaises(ValueError):
+            list(JSONArrayStream([b'{"data": [{"id": 1}, {"id"'], 'data'))
+
+    def test_extra_data(self):
+        with self.assertRaises(ValueError):
+            list(JSONArrayStream([b'{"data": []} {}'], 'data'))
+
+    def test_reads_to_end(self):
+        chunks = iter([b'{"data": [1]', b'}', b'\n'])
+        self.assertEqual(list(JSONArrayStream(chunks, 'data')), [1])
+        self.assertIsNone(next(chunks, None))
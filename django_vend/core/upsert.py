@@ -0,0 +1,128 @@
+import sqlite3
+
+from django.db import connections
+from django.utils.module_loading import import_string
+
+from django_vend.core.utils import get_vend_setting
+
+
+class ORMUpsertBackend(object):
+    """
+    Writes objects with ``bulk_create`` and ``bulk_update``, working out which
+    is which from whether they have a primary key (i.e. were loaded from the
+    database).
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def upsert(self, manager, objs, update_fields, conflict_fields,
+               batch_size=None):
+        """
+        Insert or update ``objs``. Returns the numbers of objects created and
+        updated.
+        """
+        to_create = [obj for obj in objs if obj.pk is None]
+        to_update = [obj for obj in objs if obj.pk is not None]
+        if to_create:
+            manager.bulk_create(to_create, batch_size=batch_size)
+        if to_update:
+            manager.bulk_update(to_update, update_fields,
+                                batch_size=batch_size)
+        return len(to_create), len(to_update)
+
+
+class OnConflictUpsertBackend(ORMUpsertBackend):
+    """
+    Writes objects with multi-row ``INSERT ... ON CONFLICT DO UPDATE``
+    statements, as supported by PostgreSQL and SQLite 3.24+.
+
+    The conflict fields must be covered by a unique constraint, otherwise
+    the ORM backend is used.
+    """
+
+    def supports(self, model, conflict_fields):
+        conflict_fields = tuple(conflict_fields)
+        if len(conflict_fields) == 1:
+            if model._meta.get_field(conflict_fields[0]).unique:
+                return True
+        return any(set(fields) == set(conflict_fields)
+                   for fields in model._meta.unique_together)
+
+    def upsert(self, manager, objs, update_fields, conflict_fields,
+               batch_size=None):
+        model = manager.model
+        if not conflict_fields or not self.supports(model, conflict_fields):
+            return super(OnConflictUpsertBackend, self).upsert(
+                manager, objs, update_fields, conflict_fields, batch_size)
+
+        opts = model._meta
+        fields = [f for f in opts.concrete_fields if f is not opts.pk]
+        ops = self.connection.ops
+        max_batch_size = ops.bulk_batch_size(fields, objs)
+        batch_size = min(batch_size or max_batch_size, max_batch_size)
+
+        quote = ops.quote_name
+        columns = ', '.join(quote(f.column) for f in fields)
+        conflict = ', '.join(quote(opts.get_field(name).column)
+                             for name in conflict_fields)
+        assignments = ', '.join(
+            '{0} = EXCLUDED.{0}'.format(quote(opts.get_field(name).column))
+            for name in update_fields)
+        row = '({})'.format(', '.join(['%s'] * len(fields)))
+
+        created = updated = 0
+        for i in range(0, len(objs), batch_size):
+            batch = objs[i:i + batch_size]
+            params = []
+            for obj in batch:
+                params.extend(
+                    f.get_db_prep_save(f.pre_save(obj, obj.pk is None),
+                                       connection=self.connection)
+                    for f in fields)
+            sql = 'INSERT INTO {} ({}) VALUES {} ON CONFLICT ({}) ' \
+                  'DO UPDATE SET {}'.format(
+                      quote(opts.db_table), columns,
+                      ', '.join([row] * len(batch)), conflict, assignments)
+            batch_created, batch_updated = self.execute(sql, params, batch)
+            created += batch_created
+            updated += batch_updated
+        return created, updated
+
+    def execute(self, sql, params, batch):
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+        batch_created = sum(1 for obj in batch if obj.pk is None)
+        return batch_created, len(batch) - batch_created
+
+
+class PostgreSQLUpsertBackend(OnConflictUpsertBackend):
+    """
+    Counts created and updated rows as reported by PostgreSQL, where a row
+    inserted by the statement has no deleting transaction (``xmax = 0``).
+    """
+
+    def execute(self, sql, params, batch):
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql + ' RETURNING (xmax = 0)', params)
+            inserted = [row[0] for row in cursor.fetchall()]
+        batch_created = sum(1 for row in inserted if row)
+        return batch_created, len(inserted) - batch_created
+
+
+def get_upsert_backend(using):
+    """
+    Return the upsert backend for the database ``using``, as chosen by the
+    VEND_UPSERT_BACKEND setting: a dotted path to a backend class, or
+    'auto' to use the database's native upsert where available.
+    """
+    connection = connections[using]
+    backend = get_vend_setting('VEND_UPSERT_BACKEND')
+    if backend != 'auto':
+        return import_string(backend)(connection)
+    if connection.vendor == 'postgresql':
+        return PostgreSQLUpsertBackend(connection)
+    if (connection.vendor == 'sqlite' and
+            sqlite3.sqlite_version_info >= (3, 24, 0)):
+        return OnConflictUpsertBackend(connection)
+    return ORMUpsertBackend(connection)
@@ -1,3 +1,7 @@
+import re
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
 import dateutil.parser
 
 from django.conf import settings
@@ -8,14 +12,88 @@ UUID_REGEX = '[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}'
 vend_settings = {
     'VEND_DEFAULT_USER_IMAGE': ('https://secure.vendhq.com/images/placeholder'
                                 '/customer/no-image-white-standard.png'),
+    'VEND_SYNC_BULK_BATCH_SIZE': 500,
+    'VEND_UPSERT_BACKEND': 'auto',
+    'VEND_SYNC_COMMIT_EVERY': 1000,
+    'VEND_SYNC_SKIP_INVALID': False,
+    'VEND_SYNC_PAGE_SIZE': 1000,
+    'VEND_SYNC_STREAMING': False,
+    'VEND_SYNC_FRESHNESS': {},
+    'VEND_SYNC_STALE_WHILE_REVALIDATE': False,
+    'VEND_BACKGROUND_WORKERS': 4,
+    'VEND_BACKGROUND_RUNNER': None,
+    'VEND_SYNC_LOCK_CACHE': 'default',
+    'VEND_SYNC_LOCK_TIMEOUT': 60,
+    'VEND_SYNC_SINGLE_FLIGHT_WINDOW': 0,
+    'VEND_SYNC_DEPENDENCY_FETCH_LIMIT': 5,
+    'VEND_SYNC_FETCH_WORKERS': 8,
+    'VEND_SYNC_CHECKPOINT_RETENTION': 100,
+    'VEND_HTTP_POOL_SIZE': 10,
+    'VEND_HTTP_CONNECT_TIMEOUT': 5,
+    'VEND_HTTP_READ_TIMEOUT': 30,
+    'VEND_RATE_LIMIT_REQUESTS': 300,
+    'VEND_RATE_LIMIT_PERIOD': 300,
+    'VEND_RATE_LIMIT_INTERACTIVE_RESERVE': 0.1,
+    'VEND_RATE_LIMIT_MAX_WAIT': 30,
+    'VEND_RATE_LIMIT_RETRIES': 3,
+    'VEND_HTTP_RETRIES': 3,
+    'VEND_HTTP_BACKOFF_BASE': 0.5,
+    'VEND_HTTP_BACKOFF_MAX': 10,
+    'VEND_CIRCUIT_FAILURE_THRESHOLD': 5,
+    'VEND_CIRCUIT_RESET_TIMEOUT': 30,
+    'VEND_WEBHOOK_COALESCE_DELAY': 1,
+    'VEND_RESPONSE_CACHE': None,
+    'VEND_RESPONSE_CACHE_TIMEOUT': 24 * 60 * 60,
+    'VEND_API_ARCHIVE_DIR': None,
 }
 
 def get_vend_setting(name):
-    return getattr(settings, name, None) or vend_settings.get(name)
+    # Only fall back to the default when the setting is absent, so that it
+    # can be set to 0, False or None
+    return getattr(settings, name, vend_settings.get(name))
+
+
+# The timestamp formats emitted by the Vend API, e.g. 2014-07-01T20:22:58+00:00
+# (2.0) and 2014-07-01 20:22:58 (1.0)
+VEND_DATE_RE = re.compile(
+    r'(\d{4})-(\d\d)-(\d\d)[T ](\d\d):(\d\d):(\d\d)(?:\.(\d{1,6})\d*)?'
+    r'(Z|[+-]\d\d:?\d\d)?$')
+
+
+@lru_cache(maxsize=None)
+def get_utc_offset(offset):
+    if offset == 'Z':
+        return timezone.utc
+    minutes = int(offset[1:3]) * 60 + int(offset[-2:])
+    if not minutes:
+        return timezone.utc
+    if offset[0] == '-':
+        minutes = -minutes
+    return timezone(timedelta(minutes=minutes))
+
+
+@lru_cache(maxsize=4096)
+def parse_vend_date(value):
+    """
+    Parse a timestamp in one of the formats emitted by the Vend API, or
+    return None. Results are memoised, since the same values recur across
+    the objects in a collection.
+    """
+    match = VEND_DATE_RE.match(value)
+    if match is None:
+        return None
+
+    (year, month, day, hour, minute, second,
+     fraction, offset) = match.groups()
+    return datetime(
+        int(year), int(month), int(day), int(hour), int(minute), int(second),
+        int(fraction.ljust(6, '0')) if fraction else 0,
+        get_utc_offset(offset) if offset else None)
 
 
 def parse_date(possible_date):
     if not possible_date or possible_date == "null":
         return None
     else:
-        return dateutil.parser.parse(possible_date)
+        return (parse_vend_date(possible_date) or
+                dateutil.parser.parse(possible_date))
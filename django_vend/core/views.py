@@ -1,4 +1,37 @@
+import json
+import logging
+
+from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import (HttpResponse, HttpResponseBadRequest,
+                         HttpResponseForbidden)
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from django.views.generic import View
+
+from django_vend.core.client import interactive_requests
+from django_vend.core.exceptions import VendCircuitOpenError
+from django_vend.core.utils import get_vend_setting
+from django_vend.core.webhooks import (get_webhook_managers, verify_signature,
+                                       webhook_queue)
+
+logger = logging.getLogger(__name__)
+
+
+def synchronise_for_view(manager, retailer, object_id=None, **kwargs):
+    """
+    Synchronise the data a view is about to show, with interactive priority.
+    While the Vend API is degraded (its circuit breaker is open), serve the
+    local data, if there is any.
+    """
+    with interactive_requests():
+        try:
+            manager.synchronise_if_stale(retailer, object_id, **kwargs)
+        except VendCircuitOpenError as e:
+            if not manager.has_local_data(retailer, object_id):
+                raise
+            logger.warning('Serving local %s for %s: %s',
+                           manager.get_resource_name(), retailer.name, e)
 
 
 class VendAuthMixin(LoginRequiredMixin):
@@ -7,7 +40,29 @@ class VendAuthMixin(LoginRequiredMixin):
         return self.model.objects.filter(retailer=retailer)
 
 
-class VendAuthSingleObjectSyncMixin(VendAuthMixin):
+class VendAuthSyncMixin(VendAuthMixin):
+
+    # GET parameter that forces data to be refreshed from Vend
+    refresh_param = 'refresh'
+    # Serve local data while refreshing it in the background
+    stale_while_revalidate = None
+
+    def force_refresh(self):
+        return self.refresh_param in self.request.GET
+
+    def get_stale_while_revalidate(self):
+        if self.stale_while_revalidate is not None:
+            return self.stale_while_revalidate
+        return get_vend_setting('VEND_SYNC_STALE_WHILE_REVALIDATE')
+
+    def synchronise(self, retailer, object_id=None):
+        synchronise_for_view(
+            self.model.objects, retailer, object_id,
+            force=self.force_refresh(),
+            background=self.get_stale_while_revalidate())
+
+
+class VendAuthSingleObjectSyncMixin(VendAuthSyncMixin):
 
     slug_field = 'uid'
     slug_url_kwarg = 'uid'
@@ -15,13 +70,55 @@ class VendAuthSingleObjectSyncMixin(VendAuthMixin):
     def get_object(self):
         retailer = self.request.user.vendprofile.retailer
         uid = self.kwargs.get('uid')
-        self.model.objects.synchronise(retailer, uid)
+        self.synchronise(retailer, uid)
         return super(VendAuthSingleObjectSyncMixin, self).get_object()
 
 
-class VendAuthCollectionSyncMixin(VendAuthMixin):
+class VendAuthCollectionSyncMixin(VendAuthSyncMixin):
+
+    # Leave out objects that have been deleted in Vend
+    exclude_deleted = True
+
     def get_queryset(self):
         retailer = self.request.user.vendprofile.retailer
-        self.model.objects.synchronise(retailer)
-        return super(VendAuthCollectionSyncMixin, self).get_queryset()
+        self.synchronise(retailer)
+        queryset = super(VendAuthCollectionSyncMixin, self).get_queryset()
+        if self.exclude_deleted and self.model.objects.has_field('deleted_at'):
+            queryset = queryset.filter(deleted_at__isnull=True)
+        return queryset
+
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class VendWebhookView(View):
+    """
+    Receives Vend webhooks, signed with the VEND_SECRET setting, and queues
+    the objects they name to be synchronised after responding.
+    """
+
+    http_method_names = ['post']
+    queue = webhook_queue
+
+    def post(self, request, *args, **kwargs):
+        from django_vend.auth.models import VendRetailer
+
+        secret = getattr(settings, 'VEND_SECRET', None)
+        if not verify_signature(request.body,
+                                request.META.get('HTTP_X_SIGNATURE'), secret):
+            return HttpResponseForbidden('Invalid signature')
+
+        manager = get_webhook_managers().get(request.POST.get('type'))
+        if manager is None:
+            # Acknowledge events we do not handle so they are not resent
+            return HttpResponse(status=204)
+
+        try:
+            payload = json.loads(request.POST['payload'])
+            object_id = payload['id']
+            retailer = VendRetailer.objects.get(
+                name=request.POST['domain_prefix'])
+        except (KeyError, TypeError, ValueError, VendRetailer.DoesNotExist):
+            return HttpResponseBadRequest('Invalid webhook')
 
+        self.queue.enqueue(retailer, manager, object_id)
+        return HttpResponse(status=202)
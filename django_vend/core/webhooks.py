@@ -0,0 +1,129 @@
+import atexit
+import hashlib
+import hmac
+import logging
+import threading
+
+from django.apps import apps
+
+from django_vend.core.background import run_in_background
+from django_vend.core.utils import get_vend_setting
+
+logger = logging.getLogger(__name__)
+
+
+def verify_signature(body, header, secret):
+    """
+    Check the ``X-Signature`` header Vend sends with webhooks, e.g.
+    ``signature=<hex digest>,algorithm=HMAC-SHA256``, against the raw request
+    ``body``.
+    """
+    if not header or not secret:
+        return False
+    params = dict(part.strip().split('=', 1)
+                  for part in header.split(',') if '=' in part)
+    if params.get('algorithm', 'HMAC-SHA256').upper() != 'HMAC-SHA256':
+        return False
+    expected = hmac.new(secret.encode('utf-8'), body,
+                        hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, params.get('signature', ''))
+
+
+def get_webhook_managers():
+    """
+    Return a dict of webhook event type to the manager of every installed
+    model that handles it (see VendAPIManagerMixin.webhook_events).
+    """
+    managers = {}
+    for model in apps.get_models():
+        manager = model._default_manager
+        for event in getattr(manager, 'webhook_events', ()):
+            managers[event] = manager
+    return managers
+
+
+def sync_objects(retailer_pk, model_label, object_ids):
+    """
+    Synchronise the objects of a model named by webhooks. Takes only
+    picklable arguments, so that it can be handed to a task queue by
+    VEND_BACKGROUND_RUNNER.
+    """
+    from django_vend.auth.models import VendRetailer
+
+    retailer = VendRetailer.objects.get(pk=retailer_pk)
+    manager = apps.get_model(model_label)._default_manager
+    created, errors = manager.synchronise_many(retailer, object_ids)
+    for object_id, error in errors.items():
+        logger.warning('Could not synchronise %s %s for %s: %s',
+                       manager.get_resource_name(), object_id,
+                       retailer.name, error)
+
+
+class WebhookQueue(object):
+    """
+    Coalesces the objects named by webhooks and synchronises them in the
+    background.
+
+    The objects of a resource received for a retailer within
+    VEND_WEBHOOK_COALESCE_DELAY seconds are collected in this process and
+    then synchronised together, each of them only once however many events
+    named it.
+
+    Webhooks are acknowledged while their objects are still held in this
+    process. Pending objects are flushed when the process exits normally
+    (e.g. a worker being recycled), but are lost if it is killed, in which
+    case they are only picked up by the next full synchronisation.
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+        atexit.register(self.flush_all)
+
+    def enqueue(self, retailer, manager, object_id):
+        key = (retailer.pk, manager.model._meta.label)
+        with self._lock:
+            pending = self._pending.get(key)
+            scheduled = pending is not None
+            if not scheduled:
+                pending = self._pending[key] = set()
+            pending.add(str(object_id))
+        if not scheduled:
+            timer = threading.Timer(
+                get_vend_setting('VEND_WEBHOOK_COALESCE_DELAY'),
+                self.flush, key)
+            timer.daemon = True
+            timer.start()
+
+    def flush(self, retailer_pk, model_label, wait=False):
+        """
+        Hand the pending objects of a model for a retailer to the background
+        runner, or, if ``wait`` is True and there is no
+        VEND_BACKGROUND_RUNNER, synchronise them before returning.
+        """
+        with self._lock:
+            object_ids = self._pending.pop((retailer_pk, model_label), set())
+        if not object_ids:
+            return
+        args = (retailer_pk, model_label, sorted(object_ids))
+        if wait and not get_vend_setting('VEND_BACKGROUND_RUNNER'):
+            sync_objects(*args)
+        else:
+            run_in_background(sync_objects, *args)
+
+    def flush_all(self):
+        """
+        Flush every pending object now, without waiting for the coalescing
+        delay, e.g. as the process exits.
+        """
+        with self._lock:
+            keys = list(self._pending)
+        for key in keys:
+            try:
+                self.flush(*key, wait=True)
+            except Exception:
+                logger.exception('Could not synchronise webhook objects of '
+                                 '%s for retailer %s', key[1], key[0])
+
+
+webhook_queue = WebhookQueue()
@@ -1,30 +1,21 @@
 from django import forms
 
-from django_vend.core.forms import VendDateTimeField
+from django_vend.core.exceptions import VendSyncError
+from django_vend.core.forms import VendDateTimeField, VendModelFormMixin
 from .models import VendOutlet, VendRegister
 
 
-class VendOutletForm(forms.ModelForm):
+class VendOutletForm(VendModelFormMixin, forms.ModelForm):
 
     deleted_at = VendDateTimeField(required=False)
 
     def __init__(self, data=None, *args, **kwargs):
         if data:
-            uid = data.pop('id', None)
+            uid = data.get('id')
+            data = VendOutlet.objects.field_mapping.map_partial(data)
             if uid is not None:
                 data['uid'] = uid
 
-            tax_inc = data.pop('display_prices', None)
-            if tax_inc is not None:
-                if tax_inc == 'inclusive':
-                    data['display_prices_tax_inclusive'] = True
-                elif tax_inc == 'exclusive':
-                    data['display_prices_tax_inclusive'] = False
-
-            deleted_at = data.get('deleted_at')
-            if deleted_at is not None and deleted_at == 'null':
-                data['deleted_at'] = None
-
             if 'instance' not in kwargs or kwargs['instance'] is None:
                 # Note: currently assumes instance is only ever passed as a
                 # kwarg and not an arg - need to check but this is probably bad
@@ -41,7 +32,7 @@ class VendOutletForm(forms.ModelForm):
                   'display_prices_tax_inclusive', 'deleted_at']
 
 
-class VendRegisterForm(forms.ModelForm):
+class VendRegisterForm(VendModelFormMixin, forms.ModelForm):
 
     deleted_at = VendDateTimeField(required=False)
     register_open_time = VendDateTimeField(required=False)
@@ -49,20 +40,19 @@ class VendRegisterForm(forms.ModelForm):
 
     def __init__(self, data=None, *args, **kwargs):
         if data:
-            uid = data.pop('id', None)
+            uid = data.get('id')
+            data = VendRegister.objects.field_mapping.map_partial(data)
             if uid is not None:
                 data['uid'] = uid
 
-            outlet_id = data.pop('outlet_id', None)
+            outlet_id = data.pop('outlet', None)
             if outlet_id is not None:
                 try:
-                    data['outlet'] = VendOutlet.objects.get(uid=outlet_id).pk
-                except VendOutlet.DoesNotExist:
-                    outlet = None
-
-            deleted_at = data.get('deleted_at')
-            if deleted_at is not None and deleted_at == 'null':
-                data['deleted_at'] = None
+                    outlets = VendOutlet.objects.get_uid_map([outlet_id])
+                except VendSyncError:
+                    outlets = {}
+                if outlets:
+                    data['outlet'] = outlets.popitem()[1]
 
             if 'instance' not in kwargs or kwargs['instance'] is None:
                 # Note: currently assumes instance is only ever passed as a
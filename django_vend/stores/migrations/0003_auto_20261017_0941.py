@@ -0,0 +1,39 @@
+# Generated by Django 2.2.28 on 2026-10-17 14:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vend_stores', '0002_auto_20161229_1253'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vendoutlet',
+            name='fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=40),
+        ),
+        migrations.AddField(
+            model_name='vendregister',
+            name='fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=40),
+        ),
+        migrations.AlterField(
+            model_name='vendoutlet',
+            name='uid',
+            field=models.UUIDField(unique=True),
+        ),
+        migrations.AlterField(
+            model_name='vendregister',
+            name='outlet',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='vend_stores.VendOutlet'),
+        ),
+        migrations.AlterField(
+            model_name='vendregister',
+            name='uid',
+            field=models.UUIDField(unique=True),
+        ),
+    ]
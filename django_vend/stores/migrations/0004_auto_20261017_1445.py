@@ -0,0 +1,21 @@
+# Generated by Django 2.2.28 on 2026-10-17 14:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vend_stores', '0003_auto_20261017_0941'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='vendoutlet',
+            index=models.Index(fields=['retailer', 'deleted_at'], name='vend_stores_retaile_028817_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vendregister',
+            index=models.Index(fields=['retailer', 'deleted_at'], name='vend_stores_retaile_8ffd8f_idx'),
+        ),
+    ]
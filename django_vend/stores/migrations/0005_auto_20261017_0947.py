@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-17 14:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vend_stores', '0004_auto_20261017_1445'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='vendregister',
+            index=models.Index(fields=['outlet', 'retailer'], name='vend_stores_outlet__973008_idx'),
+        ),
+    ]
@@ -3,6 +3,7 @@ from django.utils import timezone
 from django.urls import reverse
 
 from django_vend.core.managers import BaseVendAPIManager
+from django_vend.core.mapping import FieldMapping, VendField
 from django_vend.core.exceptions import VendSyncError
 from django_vend.core.utils import parse_date
 from django_vend.auth.models import VendRetailer
@@ -10,65 +11,52 @@ from django_vend.auth.models import VendRetailer
 
 class VendOutletManager(BaseVendAPIManager):
 
+    resource_name = 'outlets'
+    webhook_events = ('outlet.update',)
+
     resource_collection_url = 'https://{}.vendhq.com/api/2.0/outlets'
     resource_object_url = 'https://{}.vendhq.com/api/2.0/outlets/{}'
 
     json_collection_name = 'data'
     json_object_name = 'data'
-
-    def parse_json_object(self, json_obj):
-        obj = {
-            'name': self.get_dict_value(json_obj, 'name'),
-            'time_zone': self.get_dict_value(json_obj, 'time_zone'),
-            'currency': self.get_dict_value(json_obj, 'currency'),
-            'currency_symbol': self.get_dict_value(json_obj, 'currency_symbol'),
-            'deleted_at': parse_date(self.get_dict_value(
-                                json_obj, 'deleted_at', required=False)),
-        }
-
-        inclusive = self.get_dict_value(json_obj, 'display_prices')
-        obj['display_prices_tax_inclusive'] = (inclusive == 'inclusive')
-
-        return obj
+    versioned = True
+
+    field_mapping = FieldMapping(
+        VendField('name'),
+        VendField('time_zone'),
+        VendField('currency'),
+        VendField('currency_symbol'),
+        VendField('display_prices', 'display_prices_tax_inclusive',
+                  converter=lambda value: value == 'inclusive'),
+        VendField('deleted_at', required=False, converter=parse_date),
+    )
 
 class VendRegisterManager(BaseVendAPIManager):
 
+    resource_name = 'registers'
+    depends_on = ('outlets',)
+    related_fields = {'outlet': 'vend_stores.VendOutlet'}
+    webhook_events = ('register.update',)
+
     resource_collection_url = 'https://{}.vendhq.com/api/2.0/registers'
     resource_object_url = 'https://{}.vendhq.com/api/2.0/registers/{}'
 
     json_collection_name = 'data'
     json_object_name = 'data'
-
-    def synchronise(self, retailer, *args, **kwargs):
-        VendOutlet.objects.synchronise(retailer)
-        super(VendRegisterManager, self).synchronise(retailer, *args, **kwargs)
-
-    def parse_json_object(self, json_obj):
-        outlet_id = self.get_dict_value(json_obj, 'outlet_id')
-        try:
-            outlet = VendOutlet.objects.get(uid=outlet_id)
-        except VendOutlet.DoesNotExist:
-            raise self.sync_exception('Invalid uid {} for VendOutlet'.format(
-                outlet_id))
-
-        obj = {
-            'name': self.get_dict_value(json_obj, 'name'),
-            'outlet': outlet,
-            'invoice_prefix': self.get_dict_value(
-                                json_obj, 'invoice_prefix', required=False),
-            'invoice_suffix': self.get_dict_value(
-                                json_obj, 'invoice_suffix', required=False),
-            'invoice_sequence': self.get_dict_value(
-                                            json_obj, 'invoice_sequence'),
-            'deleted_at': parse_date(self.get_dict_value(
-                                json_obj, 'deleted_at', required=False)),
-            'is_open': self.get_dict_value(json_obj, 'is_open'),
-            'register_open_time': parse_date(self.get_dict_value(
-                            json_obj, 'register_open_time', required=False)),
-            'register_close_time': parse_date(self.get_dict_value(
-                            json_obj, 'register_close_time', required=False)),
-        }
-        return obj
+    versioned = True
+
+    field_mapping = FieldMapping(
+        VendField('name'),
+        VendField('outlet_id', 'outlet'),
+        VendField('invoice_prefix', required=False, default=''),
+        VendField('invoice_suffix', required=False, default=''),
+        VendField('invoice_sequence'),
+        VendField('deleted_at', required=False, converter=parse_date),
+        VendField('is_open', converter=bool),
+        VendField('register_open_time', required=False, converter=parse_date),
+        VendField('register_close_time', required=False,
+                  converter=parse_date),
+    )
 
 class VendOutlet(models.Model):
     # /api/outlets AND /api/2.0/outlets
@@ -95,9 +83,16 @@ class VendOutlet(models.Model):
 
     # time retrieved from Vend API
     retrieved = models.DateTimeField()
+    # digest of the data retrieved from Vend API
+    fingerprint = models.CharField(max_length=40, blank=True, editable=False)
 
     objects = VendOutletManager()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['retailer', 'deleted_at']),
+        ]
+
     def get_absolute_url(self):
         return reverse('vend_outlet_detail', args=[str(self.uid)])
 
@@ -126,9 +121,17 @@ class VendRegister(models.Model):
 
     # time retrieved from Vend API
     retrieved = models.DateTimeField()
+    # digest of the data retrieved from Vend API
+    fingerprint = models.CharField(max_length=40, blank=True, editable=False)
 
     objects = VendRegisterManager()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['retailer', 'deleted_at']),
+            models.Index(fields=['outlet', 'retailer']),
+        ]
+
     def get_absolute_url(self):
         return reverse('vend_register_detail', args=[str(self.uid)])
 
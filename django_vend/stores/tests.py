@@ -1,12 +1,40 @@
-from datetime import datetime
+import hashlib
+import hmac
+import json
+import os
+import pickle
+import re
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+from urllib.parse import urlencode
 from uuid import UUID
 
+import requests
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError, connection, transaction
 from django.utils.timezone import make_aware, now, FixedOffset
-from django.test import TestCase
+from django.test import RequestFactory, TestCase, TransactionTestCase
 
-from django_vend.auth.models import VendRetailer
-from .models import VendOutlet, VendRegister
+from django_vend.auth.models import VendRetailer, VendUser
+from django_vend.core.archive import PayloadArchive
+from django_vend.core.exceptions import VendCircuitOpenError, VendSyncError
+from django_vend.core.managers import refresh_stale
+from django_vend.core.models import VendSyncCheckpoint, VendSyncState
+from django_vend.core.stats import collect_sync_stats, record_sync_stats
+from django_vend.core.sync import (SyncRun, get_sync_managers,
+                                   order_resources, sync_run)
+from django_vend.core.views import VendWebhookView
+from django_vend.core.webhooks import WebhookQueue
+from .models import (VendOutlet, VendOutletManager, VendRegister,
+                     VendRegisterManager)
 from .forms import VendOutletForm, VendRegisterForm
+from .views import OutletList
 
 
 class VendOutletFormTestCase(TestCase):
@@ -56,6 +84,8 @@ class VendOutletFormTestCase(TestCase):
         self.assertEqual(instance.currency, currency)
         self.assertEqual(instance.display_prices_tax_inclusive, True)
         self.assertTrue(instance.deleted_at == del_time)
+        # The edited outlet is rewritten by the next synchronisation
+        self.assertEqual(instance.fingerprint, '')
 
     def test_override_instance(self):
         uid = "dc85058a-a683-11e4-ef46-e8b98f1a7ae4"
@@ -76,7 +106,7 @@ class VendOutletFormTestCase(TestCase):
         }
         VendOutlet.objects.create(uid=uid, name=name, time_zone=tz,
             currency=currency, currency_symbol=symbol, retailer=self.retailer,
-            retrieved=now())
+            retrieved=now(), fingerprint='0' * 40)
         outlets = VendOutlet.objects.all()
 
         self.assertEqual(len(outlets), 1)
@@ -222,3 +252,1064 @@ class VendRegisterFormTestCase(TestCase):
         register = registers[0]
         self.assertTrue(register.register_open_time == self.other_time)
         self.assertIsNone(register.register_close_time)
+
+
+class FakeResponse(object):
+
+    def __init__(self, data, status_code=200, headers=None):
+        self.data = data
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = json.dumps(data).encode('utf-8')
+
+    def json(self):
+        return self.data
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+
+background_calls = []
+
+
+def fake_background_runner(func, *args):
+    # A task queue would pickle the task to run it in another process
+    background_calls.append(pickle.dumps((func, args)))
+
+
+class VendOutletManagerTestCase(TestCase):
+
+    def setUp(self):
+        self.retailer = VendRetailer.objects.create(
+            name="TestRetailer",
+            access_token="some token",
+            expires=now(),
+            expires_in=0,
+            refresh_token="some other token",
+        )
+
+    def outlet_data(self, uid, name):
+        return {
+            "id": uid,
+            "name": name,
+            "time_zone": "Pacific/Auckland",
+            "default_tax_id": "b1d192bc-f019-11e3-a0f5-b8ca3a64f8f4",
+            "currency": "NZD",
+            "currency_symbol": "$",
+            "display_prices": "inclusive",
+            "deleted_at": "null",
+            "version": 1288421
+        }
+
+    def test_parse_collection(self):
+        uids = ["dc85058a-a683-11e4-ef46-e8b98f1a7ae{}".format(i)
+                for i in range(5)]
+        VendOutlet.objects.create(uid=uids[0], name="Old Name",
+            time_zone="Pacific/Auckland", currency="NZD", currency_symbol="$",
+            retailer=self.retailer, retrieved=now())
+        data = [self.outlet_data(uid, "Outlet {}".format(i))
+                for i, uid in enumerate(uids)]
+
+        # One SELECT for existing rows and one INSERT ... ON CONFLICT, in a
+        # transaction (a savepoint within the test case)
+        with self.assertNumQueries(4):
+            created = VendOutlet.objects.parse_collection(self.retailer, data)
+
+        self.assertTrue(created)
+        self.assertEqual(VendOutlet.objects.count(), 5)
+        outlet = VendOutlet.objects.get(uid=uids[0])
+        self.assertEqual(outlet.name, "Outlet 0")
+        self.assertTrue(outlet.display_prices_tax_inclusive)
+        self.assertEqual(outlet.retailer, self.retailer)
+
+        created = VendOutlet.objects.parse_collection(self.retailer, data)
+        self.assertFalse(created)
+        self.assertEqual(VendOutlet.objects.count(), 5)
+
+    def test_parse_collection_orm_backend(self):
+        uids = ["dc85058a-a683-11e4-ef46-e8b98f1a7ae{}".format(i)
+                for i in range(3)]
+        VendOutlet.objects.create(uid=uids[0], name="Old Name",
+            time_zone="Pacific/Auckland", currency="NZD", currency_symbol="$",
+            retailer=self.retailer, retrieved=now())
+        data = [self.outlet_data(uid, "Outlet {}".format(i))
+                for i, uid in enumerate(uids)]
+
+        backend = 'django_vend.core.upsert.ORMUpsertBackend'
+        # One SELECT for existing rows, one INSERT and one UPDATE, plus the
+        # transaction's savepoint
+        with self.settings(VEND_UPSERT_BACKEND=backend), \
+                self.assertNumQueries(5):
+            created = VendOutlet.objects.parse_collection(self.retailer, data)
+
+        self.assertTrue(created)
+        self.assertEqual(VendOutlet.objects.get(uid=uids[0]).name, "Outlet 0")
+        self.assertEqual(VendOutlet.objects.count(), 3)
+
+    def test_parse_collection_skips_unchanged(self):
+        uids = ["dc85058a-a683-11e4-ef46-e8b98f1a7ae{}".format(i)
+                for i in range(3)]
+        data = [self.outlet_data(uid, "Outlet {}".format(i))
+                for i, uid in enumerate(uids)]
+        VendOutlet.objects.parse_collection(self.retailer, data)
+        retrieved = VendOutlet.objects.get(uid=uids[0]).retrieved
+
+        data[1]["name"] = "Renamed Outlet"
+        # One SELECT, one upsert of the changed outlet and one UPDATE of the
+        # retrieved time of the others, plus the transaction's savepoint
+        with self.assertNumQueries(5) as context:
+            VendOutlet.objects.parse_collection(self.retailer, data)
+
+        self.assertEqual(context.captured_queries[2]['sql'].count('Outlet'), 1)
+        self.assertEqual(VendOutlet.objects.get(uid=uids[1]).name,
+                         "Renamed Outlet")
+        self.assertGreater(VendOutlet.objects.get(uid=uids[0]).retrieved,
+                           retrieved)
+
+    def test_versioned_sync(self):
+        uids = ["dc85058a-a683-11e4-ef46-e8b98f1a7ae{}".format(i)
+                for i in range(3)]
+        outlets = []
+        for i, uid in enumerate(uids):
+            outlet = self.outlet_data(uid, "Outlet {}".format(i))
+            outlet["version"] = 100 + i
+            outlets.append(outlet)
+        pages = [
+            {"data": outlets[:2], "version": {"min": 100, "max": 101}},
+            {"data": outlets[2:], "version": {"min": 102, "max": 102}},
+            {"data": []},
+        ]
+
+        with self.settings(VEND_SYNC_PAGE_SIZE=2), \
+                mock.patch.object(VendOutlet.objects.session_pool, 'get',
+                                  side_effect=map(FakeResponse, pages)) as get:
+            self.assertTrue(VendOutlet.objects.synchronise(self.retailer))
+
+        self.assertEqual(
+            [c[1]['params'] for c in get.call_args_list],
+            [{'after': 0, 'page_size': 2}, {'after': 101, 'page_size': 2}])
+        self.assertEqual(VendOutlet.objects.count(), 3)
+        state = VendSyncState.objects.get(retailer=self.retailer,
+                                          resource='outlets')
+        self.assertEqual(state.version, 102)
+
+        with self.settings(VEND_SYNC_PAGE_SIZE=2), \
+                mock.patch.object(VendOutlet.objects.session_pool, 'get',
+                                  return_value=FakeResponse(pages[2])) as get:
+            self.assertFalse(VendOutlet.objects.synchronise(self.retailer))
+        self.assertEqual(get.call_args[1]['params'],
+                         {'after': 102, 'page_size': 2})
+
+    def test_streaming_sync(self):
+        uids = ["dc85058a-a683-11e4-ef46-e8b98f1a7ae{}".format(i)
+                for i in range(3)]
+        outlets = []
+        for i, uid in enumerate(uids):
+            outlet = self.outlet_data(uid, "Outlet {}".format(i))
+            outlet["version"] = 100 + i
+            outlets.append(outlet)
+        pages = [
+            {"data": outlets[:2]},
+            {"version": {"min": 102, "max": 105}, "data": outlets[2:]},
+        ]
+
+        with self.settings(VEND_SYNC_PAGE_SIZE=2, VEND_SYNC_STREAMING=True), \
+                mock.patch.object(VendOutletManager, 'stream_chunk_size', 16), \
+                mock.patch.object(VendOutlet.objects.session_pool, 'get',
+                                  side_effect=map(FakeResponse, pages)) as get:
+            self.assertTrue(VendOutlet.objects.synchronise(self.retailer))
+
+        self.assertTrue(all(c[1]['stream'] for c in get.call_args_list))
+        self.assertEqual(
+            [c[1]['params']['after'] for c in get.call_args_list], [0, 101])
+        self.assertEqual(VendOutlet.objects.count(), 3)
+        state = VendSyncState.objects.get(retailer=self.retailer,
+                                          resource='outlets')
+        self.assertEqual(state.version, 105)
+
+    def test_streaming_sync_errors(self):
+        outlet = self.outlet_data("dc85058a-a683-11e4-ef46-e8b98f1a7ae4",
+                                  "Outlet")
+        truncated = FakeResponse({"data": [outlet, outlet]})
+        truncated.content = truncated.content[:-40]
+        dropped = FakeResponse({"data": [outlet]})
+
+        def iter_content(chunk_size=1):
+            yield dropped.content[:20]
+            raise requests.exceptions.ChunkedEncodingError('Dropped')
+        dropped.iter_content = iter_content
+
+        for response in (truncated, dropped):
+            with self.settings(VEND_SYNC_STREAMING=True), \
+                    mock.patch.object(VendOutlet.objects.session_pool, 'get',
+                                      return_value=response):
+                with self.assertRaises(VendSyncError):
+                    VendOutlet.objects.synchronise(self.retailer)
+
+    def test_full_sync_marks_missing_deleted(self):
+        uids = ["dc85058a-a683-11e4-ef46-e8b98f1a7ae{}".format(i)
+                for i in range(3)]
+        outlets = [self.outlet_data(uid, "Outlet {}".format(i))
+                   for i, uid in enumerate(uids)]
+        VendOutlet.objects.parse_collection(self.retailer, outlets)
+        other = VendRetailer.objects.create(name="OtherRetailer",
+            access_token="token", expires=now(), expires_in=0,
+            refresh_token="token")
+        VendOutlet.objects.create(uid="dc85058a-a683-11e4-ef46-e8b98f1a7ae9",
+            name="Other Outlet", time_zone="Pacific/Auckland", currency="NZD",
+            currency_symbol="$", retailer=other, retrieved=now())
+        VendSyncState.objects.create(retailer=self.retailer,
+                                     resource='outlets', version=101)
+
+        # A delta only includes changed outlets, so nothing is deleted
+        page = {"data": outlets[:1]}
+        with mock.patch.object(VendOutlet.objects.session_pool, 'get',
+                               return_value=FakeResponse(page)) as get:
+            VendOutlet.objects.synchronise(self.retailer)
+        self.assertEqual(get.call_args[1]['params']['after'], 101)
+        self.assertFalse(
+            VendOutlet.objects.filter(deleted_at__isnull=False).exists())
+
+        page = {"data": outlets[1:]}
+        with mock.patch.object(VendOutlet.objects.session_pool, 'get',
+                               return_value=FakeResponse(page)) as get:
+            VendOutlet.objects.synchronise(self.retailer, full=True)
+        self.assertEqual(get.call_args[1]['params']['after'], 0)
+
+        deleted = VendOutlet.objects.filter(deleted_at__isnull=False)
+        self.assertEqual([str(outlet.uid) for outlet in deleted], uids[:1])
+
+        # Reappearing in the collection restores an outlet
+        page = {"data": outlets}
+        with mock.patch.object(VendOutlet.objects.session_pool, 'get',
+                               return_value=FakeResponse(page)):
+            VendOutlet.objects.synchronise(self.retailer, full=True)
+        self.assertFalse(
+            VendOutlet.objects.filter(deleted_at__isnull=False).exists())
+
+    def test_full_sync_stopped_early_not_reconciled(self):
+        uids = ["dc85058a-a683-11e4-ef46-e8b98f1a7ae{}".format(i)
+                for i in range(3)]
+        outlets = [self.outlet_data(uid, "Outlet {}".format(i))
+                   for i, uid in enumerate(uids)]
+        VendOutlet.objects.parse_collection(self.retailer, outlets)
+
+        # A full page without a usable version ends the sync, but the
+        # outlets on later pages were not seen
+        for outlet in outlets:
+            outlet["version"] = None
+        page = {"data": outlets[:2]}
+        with self.settings(VEND_SYNC_PAGE_SIZE=2), \
+                mock.patch.object(VendOutlet.objects.session_pool, 'get',
+                                  return_value=FakeResponse(page)) as get:
+            VendOutlet.objects.synchronise(self.retailer, full=True)
+        self.assertEqual(get.call_count, 1)
+        self.assertFalse(
+            VendOutlet.objects.filter(deleted_at__isnull=False).exists())
+
+    def test_resume_interrupted_sync(self):
+        uids = ["dc85058a-a683-11e4-ef46-e8b98f1a7ae{}".format(i)
+                for i in range(4)]
+        outlets = []
+        for i, uid in enumerate(uids[:3]):
+            outlet = self.outlet_data(uid, "Outlet {}".format(i))
+            outlet["version"] = 100 + i
+            outlets.append(outlet)
+        VendOutlet.objects.create(uid=uids[3], name="Closed Outlet",
+            time_zone="Pacific/Auckland", currency="NZD", currency_symbol="$",
+            retailer=self.retailer, retrieved=now() - timedelta(hours=1))
+        pages = [
+            {"data": outlets[:2], "version": {"min": 100, "max": 101}},
+            {"data": outlets[2:], "version": {"min": 102, "max": 102}},
+        ]
+
+        with self.settings(VEND_SYNC_PAGE_SIZE=2), \
+                mock.patch.object(VendOutlet.objects.session_pool, 'get',
+                                  side_effect=[FakeResponse(pages[0]),
+                                               VendSyncError('Server error')]):
+            with self.assertRaises(VendSyncError):
+                VendOutlet.objects.synchronise(self.retailer)
+
+        checkpoint = VendSyncCheckpoint.objects.get(retailer=self.retailer,
+                                                    resource='outlets')
+        self.assertEqual(checkpoint.status, VendSyncCheckpoint.FAILED)
+        self.assertTrue(checkpoint.full)
+        self.assertEqual(checkpoint.version, 101)
+        self.assertEqual(checkpoint.pages, 1)
+        self.assertEqual(checkpoint.objects_retrieved, 2)
+        self.assertEqual(checkpoint.error, 'Server error')
+        self.assertFalse(
+            VendOutlet.objects.filter(deleted_at__isnull=False).exists())
+
+        # The next run continues the whole collection from the failed page
+        with self.settings(VEND_SYNC_PAGE_SIZE=2), \
+                mock.patch.object(VendOutlet.objects.session_pool, 'get',
+                                  return_value=FakeResponse(pages[1])) as get:
+            VendOutlet.objects.synchronise(self.retailer)
+        self.assertEqual(get.call_args[1]['params']['after'], 101)
+
+        checkpoint.refresh_from_db()
+        self.assertEqual(VendSyncCheckpoint.objects.count(), 1)
+        self.assertEqual(checkpoint.status, VendSyncCheckpoint.COMPLETED)
+        self.assertEqual(checkpoint.attempts, 2)
+        self.assertEqual(checkpoint.version, 102)
+        self.assertEqual(checkpoint.pages, 2)
+        self.assertEqual(checkpoint.objects_retrieved, 3)
+        self.assertEqual(checkpoint.error, '')
+        self.assertIsNotNone(checkpoint.finished)
+
+        # Outlets retrieved before the interruption are not reconciled away
+        deleted = VendOutlet.objects.filter(deleted_at__isnull=False)
+        self.assertEqual([str(outlet.uid) for outlet in deleted], uids[3:])
+
+        # A later delta starts a new run in the history
+        with self.settings(VEND_SYNC_PAGE_SIZE=2), \
+                mock.patch.object(VendOutlet.objects.session_pool, 'get',
+                                  return_value=FakeResponse({"data": []})):
+            VendOutlet.objects.synchronise(self.retailer)
+        latest = VendSyncCheckpoint.objects.first()
+        self.assertNotEqual(latest.pk, checkpoint.pk)
+        self.assertFalse(latest.full)
+        self.assertEqual(latest.status, VendSyncCheckpoint.COMPLETED)
+
+    def test_full_sync_not_shared(self):
+        path = 'django_vend.core.managers.single_flight.do'
+        with mock.patch(path, return_value=False) as do:
+            VendOutlet.objects.synchronise(self.retailer)
+            VendOutlet.objects.synchronise(self.retailer, full=True)
+        keys = [c[0][0] for c in do.call_args_list]
+        self.assertNotEqual(keys[0], keys[1])
+
+    def test_checkpoint_retention(self):
+        page = {"data": []}
+        VendSyncCheckpoint.objects.create(
+            retailer=self.retailer, resource='outlets',
+            status=VendSyncCheckpoint.FAILED, started=now(), updated=now())
+        with self.settings(VEND_SYNC_CHECKPOINT_RETENTION=2), \
+                mock.patch.object(VendOutlet.objects.session_pool, 'get',
+                                  return_value=FakeResponse(page)):
+            for i in range(4):
+                VendOutlet.objects.synchronise(self.retailer)
+
+        # The failed run was superseded by the completed ones
+        self.assertEqual(
+            list(VendSyncCheckpoint.objects.values_list('status', flat=True)),
+            [VendSyncCheckpoint.COMPLETED] * 2)
+
+    def test_reconcile(self):
+        uids = ["dc85058a-a683-11e4-ef46-e8b98f1a7ae{}".format(i)
+                for i in range(3)]
+        VendOutlet.objects.parse_collection(
+            self.retailer, [self.outlet_data(uid, "Outlet") for uid in uids])
+
+        # One SELECT of the stored uids and one UPDATE
+        with self.assertNumQueries(2):
+            deleted = VendOutlet.objects.reconcile(self.retailer, uids[:1])
+        self.assertEqual(deleted, 2)
+        with self.assertNumQueries(1):
+            VendOutlet.objects.reconcile(self.retailer, uids[:1])
+
+    def test_synchronise_many(self):
+        uids = ["dc85058a-a683-11e4-ef46-e8b98f1a7ae{}".format(i)
+                for i in range(4)]
+        outlets = {uid: self.outlet_data(uid, "Outlet {}".format(i))
+                   for i, uid in enumerate(uids)}
+        del outlets[uids[2]]["name"]
+
+        def get(url, **kwargs):
+            uid = url.rsplit('/', 1)[-1]
+            if uid not in outlets:
+                return FakeResponse({}, status_code=404)
+            if uid == uids[0]:
+                # As if the pool had retried the request
+                record_sync_stats(retries=1)
+            return FakeResponse({"data": outlets[uid]})
+
+        bulk_upsert = VendOutletManager.bulk_upsert
+
+        def reject_outlet(manager, retailer, rows):
+            if uids[3] in rows:
+                raise DatabaseError('Rejected')
+            return bulk_upsert(manager, retailer, rows)
+
+        missing = "dc85058a-a683-11e4-ef46-e8b98f1a7aef"
+        with collect_sync_stats() as stats, \
+                mock.patch.object(VendOutlet.objects.session_pool, 'get',
+                                  side_effect=get), \
+                mock.patch.object(VendOutletManager, 'bulk_upsert',
+                                  autospec=True, side_effect=reject_outlet), \
+                mock.patch.object(SyncRun, 'mark_synchronised',
+                                  autospec=True) as mark_synchronised:
+            created, errors = VendOutlet.objects.synchronise_many(
+                self.retailer, uids + [missing, uids[0]], max_workers=2)
+
+        self.assertTrue(created)
+        self.assertEqual(stats.api_calls, 5)
+        self.assertEqual(stats.retries, 1)
+        self.assertEqual(sorted(errors), [uids[2], uids[3], missing])
+        self.assertIsInstance(errors[missing], VendSyncError)
+        self.assertEqual(
+            sorted(str(uid) for uid in
+                   VendOutlet.objects.values_list('uid', flat=True)),
+            [uids[0], uids[1]])
+        self.assertEqual(
+            sorted(c[0][2] for c in mark_synchronised.call_args_list),
+            [uids[0], uids[1]])
+
+    def test_synchronise_many_invalid_objects(self):
+        uids = ["dc85058a-a683-11e4-ef46-e8b98f1a7ae{}".format(i)
+                for i in range(3)]
+        outlets = {uid: self.outlet_data(uid, "Outlet {}".format(i))
+                   for i, uid in enumerate(uids)}
+        outlets[uids[1]]["deleted_at"] = "not a date"
+        outlets[uids[2]]["id"] = "zzz"
+
+        def get(url, **kwargs):
+            return FakeResponse({"data": outlets[url.rsplit('/', 1)[-1]]})
+
+        with mock.patch.object(VendOutlet.objects.session_pool, 'get',
+                               side_effect=get):
+            created, errors = VendOutlet.objects.synchronise_many(
+                self.retailer, uids)
+
+        self.assertTrue(created)
+        self.assertEqual(sorted(errors), uids[1:])
+        self.assertTrue(all(isinstance(error, VendSyncError)
+                            for error in errors.values()))
+        self.assertEqual(
+            [str(uid) for uid in
+             VendOutlet.objects.values_list('uid', flat=True)], uids[:1])
+
+    def test_response_cache(self):
+        uid = "dc85058a-a683-11e4-ef46-e8b98f1a7ae4"
+        data = {"data": self.outlet_data(uid, "Main Outlet")}
+        responses = [
+            FakeResponse(data, headers={'ETag': '"v1"'}),
+            FakeResponse(None, status_code=304),
+            FakeResponse(data),
+        ]
+        cache.clear()
+
+        with self.settings(VEND_RESPONSE_CACHE='default'), \
+                collect_sync_stats() as stats, \
+                mock.patch.object(VendOutlet.objects.session_pool, 'get',
+                                  side_effect=responses) as get, \
+                mock.patch.object(VendOutletManager, 'parse_object',
+                                  autospec=True,
+                                  side_effect=VendOutletManager.parse_object
+                                  ) as parse_object:
+            for i in range(3):
+                VendOutlet.objects.synchronise(self.retailer, uid)
+
+        headers = [c[1]['headers'] for c in get.call_args_list]
+        self.assertNotIn('If-None-Match', headers[0])
+        self.assertEqual(headers[1]['If-None-Match'], '"v1"')
+        # Neither the 304 nor the identical body are parsed again
+        self.assertEqual(parse_object.call_count, 1)
+        self.assertEqual(stats.unchanged_responses, 2)
+        self.assertEqual(VendOutlet.objects.get().name, "Main Outlet")
+
+    def test_response_cache_failed_save(self):
+        uid = "dc85058a-a683-11e4-ef46-e8b98f1a7ae4"
+        invalid = self.outlet_data(uid, "Main Outlet")
+        del invalid["name"]
+        cache.clear()
+
+        with self.settings(VEND_RESPONSE_CACHE='default'), \
+                mock.patch.object(VendOutlet.objects.session_pool, 'get',
+                                  return_value=FakeResponse({"data": invalid})):
+            for i in range(2):
+                # Retrieved and parsed again, as it was not saved
+                with self.assertRaises(VendSyncError):
+                    VendOutlet.objects.synchronise(self.retailer, uid)
+
+    def test_freshness(self):
+        uid = "dc85058a-a683-11e4-ef46-e8b98f1a7ae4"
+        page = {"data": [self.outlet_data(uid, "Main Outlet")]}
+        freshness = {'outlets': 60}
+
+        with self.settings(VEND_SYNC_FRESHNESS=freshness), \
+                mock.patch.object(VendOutlet.objects.session_pool, 'get',
+                                  return_value=FakeResponse(page)) as get:
+            self.assertFalse(VendOutlet.objects.is_fresh(self.retailer))
+            VendOutlet.objects.synchronise_if_stale(self.retailer)
+            self.assertEqual(get.call_count, 1)
+
+            self.assertTrue(VendOutlet.objects.is_fresh(self.retailer))
+            self.assertTrue(VendOutlet.objects.is_fresh(self.retailer, uid))
+            VendOutlet.objects.synchronise_if_stale(self.retailer)
+            VendOutlet.objects.synchronise_if_stale(self.retailer, uid)
+            self.assertEqual(get.call_count, 1)
+
+            VendOutlet.objects.synchronise_if_stale(self.retailer, force=True)
+            self.assertEqual(get.call_count, 2)
+
+        self.assertFalse(VendOutlet.objects.is_fresh(self.retailer))
+
+    def test_circuit_open_serves_local_data(self):
+        view = OutletList()
+        view.request = RequestFactory().get('/')
+        error = VendCircuitOpenError('Vend API requests are failing')
+
+        with mock.patch.object(VendOutlet.objects, 'synchronise',
+                               side_effect=error):
+            # Nothing to serve yet
+            with self.assertRaises(VendCircuitOpenError):
+                view.synchronise(self.retailer)
+
+            VendOutlet.objects.parse_collection(self.retailer, [
+                self.outlet_data("dc85058a-a683-11e4-ef46-e8b98f1a7ae4",
+                                 "Main Outlet")])
+            with self.assertLogs('django_vend.core.views', 'WARNING'):
+                view.synchronise(self.retailer)
+
+    def test_stale_while_revalidate(self):
+        uid = "dc85058a-a683-11e4-ef46-e8b98f1a7ae4"
+        manager = VendOutlet.objects
+        path = 'django_vend.core.managers.run_in_background'
+        label = 'vend_stores.VendOutlet'
+        cache.clear()
+
+        with mock.patch(path) as background, \
+                mock.patch.object(VendOutletManager,
+                                  'synchronise') as synchronise:
+            # Nothing stored locally yet, so the request has to wait
+            manager.synchronise_if_stale(self.retailer, background=True)
+            synchronise.assert_called_once_with(self.retailer)
+            self.assertFalse(background.called)
+
+            manager.parse_collection(self.retailer,
+                                     [self.outlet_data(uid, "Main Outlet")])
+            synchronise.reset_mock()
+
+            # A burst of stale requests queues one refresh of each
+            for i in range(3):
+                manager.synchronise_if_stale(self.retailer, background=True)
+                manager.synchronise_if_stale(self.retailer, uid,
+                                             background=True)
+            self.assertFalse(synchronise.called)
+            self.assertEqual(background.call_args_list, [
+                mock.call(refresh_stale, self.retailer.pk, label, None),
+                mock.call(refresh_stale, self.retailer.pk, label, uid),
+            ])
+
+            # The queued refresh is arguments only, for a task queue
+            pickle.dumps(background.call_args_list)
+            refresh_stale(self.retailer.pk, label, uid)
+            synchronise.assert_called_once_with(self.retailer, uid)
+
+            # Another refresh may be queued once it has run, but is skipped
+            # if the data has become fresh meanwhile
+            background.reset_mock()
+            synchronise.reset_mock()
+            manager.synchronise_if_stale(self.retailer, uid, background=True)
+            self.assertTrue(background.called)
+            with self.settings(VEND_SYNC_FRESHNESS={'outlets': 60}):
+                refresh_stale(self.retailer.pk, label, uid)
+            self.assertFalse(synchronise.called)
+
+
+class VendWebhookTestCase(TestCase):
+
+    secret = 'webhook secret'
+    uid = "dc85058a-a683-11e4-ef46-e8b98f1a7ae4"
+
+    def setUp(self):
+        self.retailer = VendRetailer.objects.create(
+            name="testretailer",
+            access_token="some token",
+            expires=now(),
+            expires_in=0,
+            refresh_token="some other token",
+        )
+        self.queue = mock.Mock()
+        self.view = VendWebhookView.as_view(queue=self.queue)
+
+    def post(self, event_type, payload, secret=secret):
+        body = urlencode({
+            'type': event_type,
+            'domain_prefix': self.retailer.name,
+            'payload': json.dumps(payload),
+        }).encode('utf-8')
+        signature = hmac.new(secret.encode('utf-8'), body,
+                             hashlib.sha256).hexdigest()
+        request = RequestFactory().post(
+            '/webhooks/', body,
+            content_type='application/x-www-form-urlencoded',
+            HTTP_X_SIGNATURE='signature={},algorithm=HMAC-SHA256'.format(
+                signature))
+        with self.settings(VEND_SECRET=self.secret):
+            return self.view(request)
+
+    def test_enqueues_object(self):
+        response = self.post('outlet.update', {'id': self.uid})
+        self.assertEqual(response.status_code, 202)
+        self.queue.enqueue.assert_called_once_with(
+            self.retailer, VendOutlet.objects, self.uid)
+
+    def test_invalid_signature(self):
+        response = self.post('outlet.update', {'id': self.uid},
+                             secret='wrong secret')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(self.queue.enqueue.called)
+
+    def test_unhandled_event(self):
+        response = self.post('product.update', {'id': self.uid})
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(self.queue.enqueue.called)
+
+    def test_invalid_payload(self):
+        response = self.post('outlet.update', {'name': 'No id'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_queue_coalesces(self):
+        queue = WebhookQueue()
+        other = "dc85058a-a683-11e4-ef46-e8b98f1a7ae5"
+        key = (self.retailer.pk, 'vend_stores.VendOutlet')
+        del background_calls[:]
+        with mock.patch('django_vend.core.webhooks.threading.Timer') as timer:
+            for uid in (self.uid, other, self.uid):
+                queue.enqueue(self.retailer, VendOutlet.objects, uid)
+        timer.assert_called_once_with(1, queue.flush, key)
+        timer.return_value.start.assert_called_once_with()
+
+        runner = 'django_vend.stores.tests.fake_background_runner'
+        with self.settings(VEND_BACKGROUND_RUNNER=runner):
+            queue.flush(*key)
+            queue.flush(*key)
+        self.assertEqual(len(background_calls), 1)
+        func, args = pickle.loads(background_calls[0])
+        self.assertEqual(args, key + (sorted([self.uid, other]),))
+
+        # Later webhooks are coalesced again once the queue is flushed
+        with mock.patch('django_vend.core.webhooks.threading.Timer') as timer:
+            queue.enqueue(self.retailer, VendOutlet.objects, self.uid)
+        self.assertTrue(timer.called)
+
+        with mock.patch.object(VendOutletManager, 'synchronise_many',
+                               return_value=(True, {})) as sync:
+            func(*args)
+        sync.assert_called_once_with(self.retailer, args[2])
+
+    def test_flush_all(self):
+        queue = WebhookQueue()
+        with mock.patch('django_vend.core.webhooks.threading.Timer'):
+            queue.enqueue(self.retailer, VendOutlet.objects, self.uid)
+
+        # At exit the pending objects are synchronised without waiting
+        with mock.patch.object(VendOutletManager, 'synchronise_many',
+                               return_value=(True, {})) as sync:
+            queue.flush_all()
+        sync.assert_called_once_with(self.retailer, [self.uid])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Query plans differ by database')
+class IndexUsageTestCase(TestCase):
+
+    def setUp(self):
+        self.retailer = VendRetailer.objects.create(
+            name="TestRetailer",
+            access_token="some token",
+            expires=now(),
+            expires_in=0,
+            refresh_token="some other token",
+        )
+
+    def assertUsesIndex(self, queryset, *columns):
+        constraint = ' AND '.join('{}=?'.format(column) for column in columns)
+        pattern = r'USING (COVERING )?INDEX \S+ \({}\)'.format(
+            re.escape(constraint))
+        self.assertRegex(queryset.explain(), pattern)
+
+    def test_user_uid(self):
+        uid = "dc85058a-a683-11e4-ef46-e8b98f1a7ae4"
+        self.assertUsesIndex(
+            VendUser.objects.filter(retailer=self.retailer, uid=uid),
+            'retailer_id', 'uid')
+
+    def test_not_deleted(self):
+        for model in (VendOutlet, VendRegister):
+            self.assertUsesIndex(
+                model.objects.filter(retailer=self.retailer,
+                                     deleted_at__isnull=True),
+                'retailer_id', 'deleted_at')
+
+    def test_outlet_registers(self):
+        self.assertUsesIndex(
+            VendRegister.objects.filter(outlet=1, retailer=self.retailer),
+            'outlet_id', 'retailer_id')
+
+
+class VendSyncCommandTestCase(TransactionTestCase):
+
+    def setUp(self):
+        self.retailer = VendRetailer.objects.create(
+            name="TestRetailer",
+            access_token="some token",
+            expires=now(),
+            expires_in=0,
+            refresh_token="some other token",
+        )
+
+    def test_order_resources(self):
+        managers = get_sync_managers()
+        self.assertEqual(managers['outlets'], VendOutlet.objects)
+        self.assertEqual(order_resources(['registers', 'outlets'], managers),
+                         ['outlets', 'registers'])
+
+    def test_sync(self):
+        calls = []
+
+        def synchronise(self, retailer, object_id=None, full=False):
+            calls.append((self.get_resource_name(), retailer, full))
+            record_sync_stats(api_calls=1, objects=2, db_writes=2)
+
+        out = StringIO()
+        with mock.patch.object(VendOutletManager, 'synchronise', synchronise), \
+                mock.patch.object(VendRegisterManager, 'synchronise',
+                                  synchronise):
+            call_command('vend_sync', 'registers', 'outlets', workers=1,
+                         stdout=out)
+            call_command('vend_sync', 'outlets', workers=1, full=True,
+                         stdout=StringIO())
+
+        self.assertEqual(calls, [('outlets', self.retailer, False),
+                                 ('registers', self.retailer, False),
+                                 ('outlets', self.retailer, True)])
+        self.assertIn('Synchronised 4 objects', out.getvalue())
+        self.assertIn('2 API calls, 0 retries, 0 rate limit timeouts, '
+                      '4 DB writes', out.getvalue())
+
+    def test_retailer_failure(self):
+        other = VendRetailer.objects.create(name="OtherRetailer",
+            access_token="token", expires=now(), expires_in=0,
+            refresh_token="token")
+
+        def synchronise(self, retailer, object_id=None, full=False):
+            if retailer == other:
+                raise DatabaseError('Database failure')
+            record_sync_stats(objects=1)
+
+        out = StringIO()
+        err = StringIO()
+        with mock.patch.object(VendOutletManager, 'synchronise', synchronise), \
+                self.assertLogs('django_vend.core.management.commands',
+                                'ERROR'), \
+                self.assertRaisesMessage(CommandError,
+                                         '1 of 2 retailer(s) failed'):
+            call_command('vend_sync', 'outlets', workers=1, stdout=out,
+                         stderr=err)
+        self.assertIn('OtherRetailer: failed (Database failure)',
+                      err.getvalue())
+        self.assertIn('Synchronised 1 objects', out.getvalue())
+
+    def test_unknown_resource(self):
+        with self.assertRaises(CommandError):
+            call_command('vend_sync', 'products')
+
+
+class PayloadArchiveTestCase(TestCase):
+
+    def setUp(self):
+        self.retailer = VendRetailer.objects.create(
+            name="TestRetailer",
+            access_token="some token",
+            expires=now(),
+            expires_in=0,
+            refresh_token="some other token",
+        )
+        self.archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_dir)
+
+    def outlet_data(self, uid, name):
+        return {
+            "id": uid,
+            "name": name,
+            "time_zone": "Pacific/Auckland",
+            "currency": "NZD",
+            "currency_symbol": "$",
+            "display_prices": "inclusive",
+            "version": 100,
+        }
+
+    def test_archive_and_replay(self):
+        uids = ["dc85058a-a683-11e4-ef46-e8b98f1a7ae{}".format(i)
+                for i in range(3)]
+        collection = {"data": [self.outlet_data(uid, "Outlet")
+                               for uid in uids[:2]]}
+        single = {"data": self.outlet_data(uids[2], "Single Outlet")}
+        responses = [FakeResponse(collection), FakeResponse(single)]
+
+        with self.settings(VEND_API_ARCHIVE_DIR=self.archive_dir), \
+                mock.patch.object(VendOutlet.objects.session_pool, 'get',
+                                  side_effect=responses):
+            VendOutlet.objects.synchronise(self.retailer)
+            VendOutlet.objects.synchronise(self.retailer, uids[2])
+
+        archived = os.listdir(
+            os.path.join(self.archive_dir, "TestRetailer", "outlets"))
+        self.assertEqual(len(archived), 2)
+        self.assertTrue(all(name.endswith('.json.gz') for name in archived))
+
+        VendOutlet.objects.all().delete()
+        out = StringIO()
+        with mock.patch.object(VendOutlet.objects.session_pool, 'get') as get:
+            call_command('vend_replay', 'outlets',
+                         archive_dir=self.archive_dir, stdout=out)
+        self.assertFalse(get.called)
+        self.assertIn('Replayed 2 payload(s): 3 objects', out.getvalue())
+        self.assertEqual(VendOutlet.objects.count(), 3)
+        self.assertEqual(VendOutlet.objects.get(uid=uids[2]).name,
+                         "Single Outlet")
+
+    def test_replay_rollback(self):
+        archive = PayloadArchive(self.archive_dir)
+        archive.save(self.retailer, 'outlets', json.dumps({"data": [
+            self.outlet_data("dc85058a-a683-11e4-ef46-e8b98f1a7ae0",
+                             "Outlet")]}).encode('utf-8'))
+
+        call_command('vend_replay', archive_dir=self.archive_dir,
+                     rollback=True, stdout=StringIO())
+        self.assertFalse(VendOutlet.objects.exists())
+
+    def test_streamed_response_archived(self):
+        page = {"data": [self.outlet_data(
+            "dc85058a-a683-11e4-ef46-e8b98f1a7ae0", "Outlet")]}
+        with self.settings(VEND_API_ARCHIVE_DIR=self.archive_dir,
+                           VEND_SYNC_STREAMING=True), \
+                mock.patch.object(VendOutlet.objects.session_pool, 'get',
+                                  return_value=FakeResponse(page)):
+            VendOutlet.objects.synchronise(self.retailer)
+
+        payloads = list(PayloadArchive(self.archive_dir).iter_payloads())
+        self.assertEqual(len(payloads), 1)
+        self.assertEqual(payloads[0].load(), page)
+
+    def test_interrupted_stream_not_archived(self):
+        response = FakeResponse({"data": [self.outlet_data(
+            "dc85058a-a683-11e4-ef46-e8b98f1a7ae0", "Outlet")]})
+
+        def iter_content(chunk_size=1):
+            yield response.content[:20]
+            raise requests.exceptions.ChunkedEncodingError('Dropped')
+        response.iter_content = iter_content
+
+        with self.settings(VEND_API_ARCHIVE_DIR=self.archive_dir,
+                           VEND_SYNC_STREAMING=True), \
+                mock.patch.object(VendOutlet.objects.session_pool, 'get',
+                                  return_value=response):
+            with self.assertRaises(VendSyncError):
+                VendOutlet.objects.synchronise(self.retailer)
+
+        self.assertEqual(
+            os.listdir(os.path.join(self.archive_dir, "TestRetailer",
+                                    "outlets")), [])
+
+    def test_archive_errors_do_not_fail_sync(self):
+        # The archive directory cannot be created under a file
+        archive_dir = os.path.join(self.archive_dir, 'file')
+        open(archive_dir, 'w').close()
+        page = {"data": [self.outlet_data(
+            "dc85058a-a683-11e4-ef46-e8b98f1a7ae0", "Outlet")]}
+
+        for streaming in (False, True):
+            VendOutlet.objects.all().delete()
+            with self.settings(VEND_API_ARCHIVE_DIR=archive_dir,
+                               VEND_SYNC_STREAMING=streaming), \
+                    mock.patch.object(VendOutlet.objects.session_pool, 'get',
+                                      return_value=FakeResponse(page)), \
+                    self.assertLogs('django_vend.core.archive', 'ERROR'):
+                VendOutlet.objects.synchronise(self.retailer, full=True)
+            self.assertEqual(VendOutlet.objects.count(), 1)
+
+    def test_replay_ignores_stray_files(self):
+        archive = PayloadArchive(self.archive_dir)
+        archive.save(self.retailer, 'outlets', json.dumps({"data": [
+            self.outlet_data("dc85058a-a683-11e4-ef46-e8b98f1a7ae0",
+                             "Outlet")]}).encode('utf-8'))
+        open(os.path.join(self.archive_dir, 'README'), 'w').close()
+        open(os.path.join(self.archive_dir, 'TestRetailer', 'notes'),
+             'w').close()
+
+        self.assertEqual(len(list(archive.iter_payloads())), 1)
+
+    def test_replay_corrupt_payload(self):
+        archive = PayloadArchive(self.archive_dir)
+        path = archive.get_path(self.retailer.name, 'outlets')
+        with open(path, 'wb') as f:
+            f.write(b'not gzip')
+
+        err = StringIO()
+        with self.assertRaisesMessage(CommandError, '1 payload(s) failed'):
+            call_command('vend_replay', archive_dir=self.archive_dir,
+                         stdout=StringIO(), stderr=err)
+        self.assertIn('failed', err.getvalue())
+
+    def test_replay_missing_archive(self):
+        with self.assertRaisesMessage(CommandError, 'does not exist'):
+            call_command('vend_replay', stdout=StringIO(),
+                         archive_dir=os.path.join(self.archive_dir, 'none'))
+
+
+class VendRegisterManagerTestCase(TestCase):
+
+    def setUp(self):
+        self.retailer = VendRetailer.objects.create(
+            name="TestRetailer",
+            access_token="some token",
+            expires=now(),
+            expires_in=0,
+            refresh_token="some other token",
+        )
+        self.outlet = VendOutlet.objects.create(
+            uid="b8ca3a65-0183-11e4-fbb5-2816d2677218",
+            name="Main Outlet",
+            time_zone="Pacific/Auckland",
+            currency="NZD",
+            currency_symbol="$",
+            retailer=self.retailer,
+            retrieved=now()
+        )
+
+    def register_data(self, uid, outlet_id):
+        return {
+            "id": uid,
+            "name": "Register",
+            "outlet_id": outlet_id,
+            "invoice_prefix": "PRE",
+            "invoice_suffix": "SUF",
+            "invoice_sequence": 1234,
+            "is_open": True,
+            "register_open_time": "2015-03-16T22:21:50+00:00",
+            "register_close_time": "null",
+            "deleted_at": "null",
+            "version": 1288421
+        }
+
+    def test_parse_collection_resolves_outlets(self):
+        data = [self.register_data(
+                    "dc85058a-a683-11e4-ef46-e8b98f1a7ae{}".format(i),
+                    str(self.outlet.uid))
+                for i in range(5)]
+
+        # One query for the outlet map, whatever the number of registers
+        with self.assertNumQueries(5):
+            VendRegister.objects.parse_collection(self.retailer, data)
+
+        self.assertEqual(
+            VendRegister.objects.filter(outlet=self.outlet).count(), 5)
+
+    def test_invalid_outlet(self):
+        data = [self.register_data("dc85058a-a683-11e4-ef46-e8b98f1a7ae4",
+                                   "b8ca3a65-0183-11e4-fbb5-2816d2677219")]
+        with self.assertRaises(VendSyncError):
+            VendRegister.objects.parse_collection(self.retailer, data)
+
+    def fake_api(self, registers, outlets):
+        def get(url, params=None, **kwargs):
+            calls.append(url.split('/api/2.0/')[1])
+            if url.endswith('/registers'):
+                return FakeResponse({"data": registers})
+            if url.endswith('/outlets'):
+                return FakeResponse({"data": outlets})
+            for obj in registers + outlets:
+                if url.endswith(obj["id"]):
+                    return FakeResponse({"data": obj})
+        calls = []
+        patch = mock.patch.object(VendRegister.objects.session_pool, 'get',
+                                  side_effect=get)
+        return patch, calls
+
+    def outlet_data(self, uid):
+        return {
+            "id": uid,
+            "name": "Outlet",
+            "time_zone": "Pacific/Auckland",
+            "currency": "NZD",
+            "currency_symbol": "$",
+            "display_prices": "inclusive",
+            "version": 1288421
+        }
+
+    def test_sync_referenced_outlet(self):
+        uid = "dc85058a-a683-11e4-ef46-e8b98f1a7ae4"
+        outlet_id = str(self.outlet.uid)
+        patch, calls = self.fake_api([self.register_data(uid, outlet_id)],
+                                     [self.outlet_data(outlet_id)])
+
+        with patch:
+            VendRegister.objects.synchronise(self.retailer, uid)
+        self.assertEqual(calls, ['registers/' + uid, 'outlets/' + outlet_id])
+
+        del calls[:]
+        with patch, self.settings(VEND_SYNC_FRESHNESS={'outlets': 60}):
+            VendRegister.objects.synchronise(self.retailer)
+        self.assertEqual(calls, ['registers'])
+
+    def test_unknown_outlet_refreshes_outlets(self):
+        uid = "dc85058a-a683-11e4-ef46-e8b98f1a7ae4"
+        outlet_id = "b8ca3a65-0183-11e4-fbb5-2816d2677219"
+        patch, calls = self.fake_api([self.register_data(uid, outlet_id)],
+                                     [self.outlet_data(outlet_id)])
+
+        with patch:
+            VendRegister.objects.synchronise(self.retailer)
+        self.assertEqual(calls, ['registers', 'outlets'])
+        self.assertEqual(VendRegister.objects.get(uid=uid).outlet.uid,
+                         UUID(outlet_id))
+
+    def test_sync_run_skips_fresh_dependencies(self):
+        uid = "dc85058a-a683-11e4-ef46-e8b98f1a7ae4"
+        patch, calls = self.fake_api(
+            [self.register_data(uid, str(self.outlet.uid))], [])
+
+        with patch, self.settings(VEND_SYNC_FRESHNESS={'outlets': 60}):
+            VendSyncState.objects.create(retailer=self.retailer,
+                                         resource='outlets', synchronised=now())
+            with sync_run(self.retailer) as run:
+                self.assertEqual(run.plan(['registers']),
+                                 ['outlets', 'registers'])
+                run.synchronise(['registers'])
+        self.assertEqual(calls, ['registers'])
+
+    def test_commit_every(self):
+        data = [self.register_data(
+                    "dc85058a-a683-11e4-ef46-e8b98f1a7ae{}".format(i),
+                    str(self.outlet.uid))
+                for i in range(5)]
+
+        with self.settings(VEND_SYNC_COMMIT_EVERY=2), \
+                mock.patch('django_vend.core.managers.transaction.atomic',
+                           wraps=transaction.atomic) as atomic:
+            VendRegister.objects.parse_collection(self.retailer, data)
+
+        self.assertEqual(atomic.call_count, 3)
+        self.assertEqual(VendRegister.objects.count(), 5)
+
+    def test_skip_invalid(self):
+        data = [self.register_data(
+                    "dc85058a-a683-11e4-ef46-e8b98f1a7ae{}".format(i),
+                    str(self.outlet.uid))
+                for i in range(7)]
+        data[1]["outlet_id"] = "b8ca3a65-0183-11e4-fbb5-2816d2677219"
+        del data[2]["name"]
+        data[3]["invoice_sequence"] = -1
+        data[4]["deleted_at"] = "not a date"
+        data[5]["deleted_at"] = "2016-13-45T00:00:00+00:00"
+        data[6]["id"] = "zzz"
+
+        with self.settings(VEND_SYNC_SKIP_INVALID=True), \
+                collect_sync_stats() as stats:
+            VendRegister.objects.parse_collection(self.retailer, data)
+
+        self.assertEqual(stats.skipped, 6)
+        self.assertEqual(
+            list(VendRegister.objects.values_list('uid', flat=True)),
+            [UUID(data[0]["id"])])
+
+        with self.assertRaises(VendSyncError):
+            VendRegister.objects.parse_collection(self.retailer, data)